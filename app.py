@@ -1,27 +1,29 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, send_from_directory
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 import os
 from config import Config
-from database import init_db
+from database import init_db, get_db
+from utils import availability_index, image_jobs, text_index
+from utils.property_cards import backfill_cards
+from utils.uploads import UploadRequest
 
 
 app = Flask(__name__)
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173").split(",")
 app.config.from_object(Config)
 
+# Cap of a whole request; uploaded files are streamed to disk and checked per file while
+# the body is read (utils/uploads.py)
 app.config['MAX_CONTENT_LENGTH'] = Config.IMAGE_MAX_COUNT * Config.IMAGE_MAX_MB * 1024 * 1024
-print("R2 ACTIVE:", Config.USE_R2, "ENDPOINT:", Config.R2_ENDPOINT, "PUBLIC:", Config.R2_PUBLIC_BASE_URL,
-          flush=True)
-if Config.USE_R2 and (not Config.R2_PUBLIC_BASE_URL or not Config.R2_BUCKET_NAME):
-    raise RuntimeError("R2 misconfigured: set R2_PUBLIC_BASE_URL and R2_BUCKET_NAME")
+app.request_class = UploadRequest
 
 app.config['JSON_SORT_KEYS'] = False
 
 CORS(app, resources={r"/*": {"origins": allowed_origins}},
   supports_credentials=False,
   methods=["GET", "HEAD", "OPTIONS","POST"],
-  allow_headers=["Content-Type", "Accept", "Authorization"])
+  allow_headers=["Content-Type", "Accept", "Authorization", "Idempotency-Key"])
 
 # auth(authentication) route
 from routes.auth import auth_bp
@@ -56,11 +58,47 @@ app.register_blueprint(booking_bp)
 from routes.destinations import destinations_bp
 app.register_blueprint(destinations_bp)
 
+from routes.quotes import quotes_bp
+app.register_blueprint(quotes_bp)
+
+# Images in local storage (USE_R2=false), unless IMAGE_LOCAL_BASE_URL points elsewhere
+if not Config.USE_R2 and Config.IMAGE_LOCAL_BASE_URL.startswith('/'):
+    @app.route(f'{Config.IMAGE_LOCAL_BASE_URL}/<path:key>')
+    def local_image(key):
+        response = send_from_directory(os.path.abspath(Config.IMAGE_LOCAL_DIR), key)
+        # Keys are content-addressed, so a file never changes
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
 
 jwt = JWTManager(app)
 
-with app.app_context():
-    init_db()
+
+def startup():
+    """ Schema, card backfill and the in-memory indexes, once per server process. """
+    print("R2 ACTIVE:", Config.USE_R2, "ENDPOINT:", Config.R2_ENDPOINT, "PUBLIC:", Config.R2_PUBLIC_BASE_URL,
+              flush=True)
+    if Config.USE_R2 and (not Config.R2_PUBLIC_BASE_URL or not Config.R2_BUCKET_NAME):
+        raise RuntimeError("R2 misconfigured: set R2_PUBLIC_BASE_URL and R2_BUCKET_NAME")
+
+    with app.app_context():
+        init_db()
+        with get_db() as db:
+            backfill_cards(db)
+        if availability_index.enabled():
+            with get_db() as db:
+                availability_index.rebuild(db)
+        if text_index.enabled():
+            with get_db() as db:
+                text_index.rebuild(db)
+        with get_db() as db:
+            image_jobs.fail_stale(db)
+
+
+# Under `python app.py`, the image encoding processes (spawned, utils/images.py) import this
+# module again as __mp_main__; they only need the code, not the startup work.
+if __name__ != '__mp_main__':
+    startup()
 
 
 @app.route('/')
@@ -0,0 +1,127 @@
+"""
+Image variant encoding: peak memory and latency per upload.
+
+    python benchmarks/image_decode.py [repeat]
+
+Compares the original pipeline (full-size decode, exif_transpose, then a full-size copy per
+variant, kept below as `legacy_variants`) with encode_variants (draft-mode decode near the
+largest variant, shrunk in place). Each mode runs in a fresh interpreter so its peak RSS is
+its own; the table shows the peak over the interpreter's RSS before the first image.
+"""
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import ExifTags, Image, ImageOps
+
+from utils.images import VARIANTS, encode_variants
+
+
+def legacy_variants(path):
+    """ The encoding before user-022, for comparison. """
+    img = Image.open(path)
+    img = ImageOps.exif_transpose(img).convert('RGB')
+    img.info.pop('exif', None)
+    variants = {}
+    for name, px in VARIANTS.items():
+        out = img.copy()
+        out.thumbnail((px, px), resample=Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        out.save(buf, format='WEBP', method=5, quality=82, optimize=True)
+        variants[name] = (buf.getvalue(), out.width, out.height, buf.tell())
+        out.close()
+    return img.width, img.height, variants
+
+
+MODES = {'legacy': legacy_variants, 'encode_variants': encode_variants}
+
+
+def _photo(size):
+    """ Noisy gradients: compresses like a photo, unlike a flat colour. """
+    noise = Image.effect_noise(size, 48)
+    return Image.merge('RGB', (
+        Image.linear_gradient('L').resize(size),
+        noise,
+        Image.linear_gradient('L').rotate(90).resize(size),
+    ))
+
+
+def sample_inputs(directory):
+    inputs = []
+
+    path = os.path.join(directory, 'phone-12mp.jpg')
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6  # portrait shot stored sideways
+    _photo((4032, 3024)).save(path, format='JPEG', quality=90, exif=exif)
+    inputs.append(path)
+
+    path = os.path.join(directory, 'camera-40mp.jpg')
+    _photo((7728, 5152)).save(path, format='JPEG', quality=90)
+    inputs.append(path)
+
+    path = os.path.join(directory, 'screenshot-6mp.png')
+    _photo((3000, 2000)).save(path, format='PNG')
+    inputs.append(path)
+    return inputs
+
+
+def _max_rss_kb():
+    # VmHWM starts over at exec; ru_maxrss would carry the parent's peak from before the fork
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+
+
+def run_one(mode, path, repeat):
+    """ Child process: encodes `path` `repeat` times, prints baseline RSS, peak RSS and latencies. """
+    encode = MODES[mode]
+    baseline = _max_rss_kb()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(path)
+        latencies.append(time.perf_counter() - started)
+    print(baseline, _max_rss_kb(), *latencies)
+
+
+def measure(mode, path, repeat):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, path, str(repeat)],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    baseline, peak = int(out[0]), int(out[1])
+    latencies = sorted(float(x) for x in out[2:])
+    return (peak - baseline) / 1024, latencies[len(latencies) // 2]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    with tempfile.TemporaryDirectory(prefix='image_decode_') as directory:
+        inputs = sample_inputs(directory)
+        print(f'{"input":<34} {"mode":<16} {"peak MB":>8} {"median s":>9}')
+        for path in inputs:
+            with Image.open(path) as img:
+                label = f'{os.path.basename(path)} {img.width}x{img.height}'
+            for mode in MODES:
+                peak_mb, median = measure(mode, path, repeat)
+                print(f'{label:<34} {mode:<16} {peak_mb:>8.0f} {median:>9.2f}')
+                label = ''
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        run_one(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
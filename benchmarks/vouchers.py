@@ -0,0 +1,91 @@
+"""
+Voucher rendering throughput (vouchers per second).
+
+    python benchmarks/vouchers.py [count]
+
+Compares the original renderer (logo decoded and header drawn on every call, kept below as
+`legacy_voucher_pdf`), the current single-voucher path (generate_voucher_pdf, as used by
+utils/vouchers.py) and batch rendering into one multi-page PDF (render_voucher_batch).
+"""
+import io
+import os
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # the legacy renderer reads static/logo.png relative to the working directory
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from utils.pdf_generator import _voucher_lines, generate_voucher_pdf, render_voucher_batch
+
+
+def legacy_voucher_pdf(booking, guest_info, property_):
+    """ The renderer before user-017, for comparison. """
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    try:
+        p.drawImage(ImageReader("static/logo.png"), 50, height - 100, width=120, height=50, mask='auto')
+    except Exception:
+        pass
+    p.setFont("Helvetica-Bold", 18)
+    p.drawString(200, height - 80, "Booking Voucher")
+    p.line(50, height - 100, width - 50, height - 100)
+    p.setFont("Helvetica", 12)
+    y = height - 130
+    for line in _voucher_lines(booking, guest_info, property_):
+        p.drawString(70, y, line)
+        y -= 20
+    p.showPage()
+    p.save()
+    buffer.seek(0)
+    return buffer
+
+
+def sample_vouchers(count):
+    property_ = SimpleNamespace(title='Sea view flat', location='Lisbon')
+    guest_info = {
+        'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '+351 900 000 000',
+        'address': {'street': 'Rua Augusta 1', 'city': 'Lisbon', 'province': 'Lisboa', 'postal_code': '1100-048'},
+    }
+    start = date.today()
+    return [
+        (SimpleNamespace(id=i, check_in=start + timedelta(days=i), check_out=start + timedelta(days=i + 3),
+                         total_price=Decimal('360.00')), guest_info, property_)
+        for i in range(count)
+    ]
+
+
+def measure(label, count, render):
+    started = time.perf_counter()
+    size = render()
+    seconds = time.perf_counter() - started
+    print(f'{label:<28} {count / seconds:>9.0f} vouchers/s   {size / count / 1024:>6.1f} KB/voucher')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    vouchers = sample_vouchers(count)
+    generate_voucher_pdf(*vouchers[0])  # warm-up: logo and fonts loaded once per process
+
+    # utils.pdf_generator turns ASCII85 off for the whole process; the legacy code ran with it on
+    rl_config.useA85 = 1
+    measure('legacy (one PDF each)', count,
+            lambda: sum(len(legacy_voucher_pdf(*v).getvalue()) for v in vouchers))
+    rl_config.useA85 = 0
+    measure('generate_voucher_pdf', count,
+            lambda: sum(len(generate_voucher_pdf(*v).getvalue()) for v in vouchers))
+    measure('render_voucher_batch', count,
+            lambda: len(render_voucher_batch(vouchers).getvalue()))
+
+
+if __name__ == '__main__':
+    main()
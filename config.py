@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -10,6 +11,23 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
+    # Process-local availability index used by search and booking checks
+    AVAILABILITY_INDEX = os.getenv('AVAILABILITY_INDEX', 'true').lower() == 'true'
+    # Process-local trigram index for location/title substring matching
+    TEXT_INDEX = os.getenv('TEXT_INDEX', 'true').lower() == 'true'
+    # /search response cache (entries, seconds); SEARCH_CACHE_SIZE=0 disables it
+    SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1024'))
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '60'))
+
+    # Idempotency-Key support for POST /bookings and /properties (keys kept in the DB for
+    # IDEMPOTENCY_TTL seconds)
+    IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+
+    # Booking vouchers: background render workers and the directory the PDFs are kept in
+    VOUCHER_WORKERS = int(os.getenv('VOUCHER_WORKERS', '2'))
+    VOUCHER_DIR = os.getenv('VOUCHER_DIR', 'vouchers')
+
     # Images
     USE_R2 = os.getenv('USE_R2', 'false').lower() == 'true'
     R2_ACCOUNT_ID = os.getenv('R2_ACCOUNT_ID')
@@ -26,6 +44,20 @@ class Config:
     # Public domain to display (now r2.dev which the dashboard gave me)
     R2_PUBLIC_BASE_URL = os.getenv('R2_PUBLIC_BASE_URL', '').rstrip('/')
 
+    # Local image storage (USE_R2=false): directory of the files and the URL prefix serving them
+    IMAGE_LOCAL_DIR = os.getenv("IMAGE_LOCAL_DIR", "media")
+    IMAGE_LOCAL_BASE_URL = os.getenv("IMAGE_LOCAL_BASE_URL", "/media").rstrip('/')
+
     IMAGE_MAX_COUNT = int(os.getenv("IMAGE_MAX_COUNT", "30"))
     IMAGE_MAX_MB = int(os.getenv("IMAGE_MAX_MB", "15"))
+    # Image pipeline: processes encoding the WebP variants (0 = encode in the upload threads)
+    # and threads writing them to storage (with R2, at most the S3 client's 32 pooled connections are used)
+    IMAGE_ENCODE_WORKERS = int(os.getenv("IMAGE_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    IMAGE_UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "16"))
+    # Background upload jobs: concurrent jobs, jobs queued at most, and where uploads are spooled
+    IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+    IMAGE_JOB_MAX_PENDING = int(os.getenv("IMAGE_JOB_MAX_PENDING", "50"))
+    # A queued/running job without news for this long is taken for lost (its worker died) and failed
+    IMAGE_JOB_STALE_SECONDS = int(os.getenv("IMAGE_JOB_STALE_SECONDS", "1800"))
+    IMAGE_SPOOL_DIR = os.getenv("IMAGE_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "dream_stay_uploads")
 
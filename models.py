@@ -1,7 +1,7 @@
 import enum
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Date, Enum, Numeric, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Date, Enum, Numeric, UniqueConstraint, Index, JSON, LargeBinary, and_
 from sqlalchemy.orm import declarative_base, relationship
 
 
@@ -45,7 +45,8 @@ class Property(Base):
     host_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     is_approved = Column(Boolean, default=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-
+    # Incremented on every change to the property's availability (see utils/availability_index.py).
+    calendar_version = Column(Integer, default=0, server_default='0', nullable=False)
 
     # Prevent duplicate storage
     __table_args__ = (
@@ -67,8 +68,10 @@ class PropertyImage(Base):
 
     id = Column(Integer, primary_key=True)
     property_id = Column(Integer, ForeignKey('properties.id'), nullable=False)
-    # Relative storage path/key (e.g. property/12/uuid_medium.webp)
-    storage_key = Column(String(512), nullable=False, unique=True)
+    # Relative storage path/key (e.g. images/<sha256>/medium.webp); shared by identical uploads
+    storage_key = Column(String(512), nullable=False, index=True)
+    # Stored variants of the image (NULL for images uploaded before content addressing)
+    digest = Column(String(64), ForeignKey('image_blobs.digest'), index=True)
 
     # Displayable URLs (relative to IMAGE_BASE_URL)
     url = Column(String(512), nullable=False) # Original version/medium
@@ -89,6 +92,82 @@ class PropertyImage(Base):
 
     property = relationship('Property', back_populates='images')
 
+class ImageBlob(Base):
+    """
+    The stored WebP variants of one source image, keyed by the SHA-256 of its bytes (see
+    utils/images.py). `ref_count` counts the PropertyImage rows using it; the objects are
+    removed from storage when the last one is deleted.
+    """
+    __tablename__ = 'image_blobs'
+
+    digest = Column(String(64), primary_key=True)
+    meta = Column(JSON, nullable=False)  # width, height, keys and URLs of the variants
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class ImageJob(Base):
+    """
+    A background image upload (see utils/image_jobs.py): files are spooled to disk, processed
+    by a worker pool and inserted as PropertyImage rows. `files` holds one entry per file:
+    {"filename", "status": "pending" | "succeeded" | "failed", "id"?, "url"?, "error"?}.
+    """
+    __tablename__ = 'image_jobs'
+
+    id = Column(String(32), primary_key=True)
+    property_id = Column(Integer, ForeignKey('properties.id'), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    status = Column(String(16), nullable=False, default='queued')  # queued, running, done, failed
+    files = Column(JSON, nullable=False)
+    metrics = Column(JSON)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime)
+    # Written when the job is created, starts and reports progress (naive UTC); a queued or
+    # running job whose heartbeat is IMAGE_JOB_STALE_SECONDS old is failed as lost
+    heartbeat_at = Column(DateTime)
+
+class IdempotencyKey(Base):
+    """
+    An Idempotency-Key of a POST request (see utils/idempotency.py), shared by all worker
+    processes. While the first request runs the row is 'in_progress' and holds a short lease
+    (expires_at); then it stores the response to replay until the TTL ends.
+    """
+    __tablename__ = 'idempotency_keys'
+
+    id = Column(Integer, primary_key=True)
+    endpoint = Column(String(128), nullable=False)
+    user_id = Column(String(64), nullable=False)
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the request body
+    status = Column(String(16), nullable=False, default='in_progress')  # in_progress, done
+    response_status = Column(Integer)
+    response_mimetype = Column(String(128))
+    response_headers = Column(JSON)
+    response_body = Column(LargeBinary)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('endpoint', 'user_id', 'key', name='uq_idempotency_scope'),
+    )
+
+class PropertyCard(Base):
+    """
+    Denormalized listing data of a property (one row per property), so listings and search
+    don't load Property/PropertyImage relationships. Maintained by utils/property_cards.py.
+    """
+    __tablename__ = 'property_cards'
+
+    property_id = Column(Integer, ForeignKey('properties.id'), primary_key=True)
+    host_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    title = Column(String, nullable=False)
+    location = Column(String, nullable=False)
+    description = Column(String)
+    is_approved = Column(Boolean, default=True)
+    cover_url = Column(String(512))
+    thumb_url = Column(String(512))
+    image_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 class Availability(Base):
     """ Availability per date for a specific property (price & availability flags). """
     __tablename__ = 'availability'
@@ -100,6 +179,40 @@ class Availability(Base):
     is_reserved = Column(Boolean, default=False, nullable=False)
     is_available = Column(Boolean, default=False, nullable=False)
     is_blocked = Column(Boolean, default=False)
+    # Who set the block: 'import' for blocks written by a calendar import (which a later
+    # import may clear), NULL for the host's own blocks
+    blocked_by = Column(String(16))
+
+    __table_args__ = (
+        # One row per night; also the index of every (property_id, date range) lookup.
+        UniqueConstraint('property_id', 'date', name='uq_availability_property_date'),
+        # Bookable nights only (same predicate as utils/search.BOOKABLE), covering the price:
+        # serves the per-candidate night count/total of the SQL search (utils/search._sql_base).
+        Index(
+            'ix_availability_bookable', 'property_id', 'date', 'price',
+            sqlite_where=and_(is_available == True, is_reserved == False, is_blocked.isnot(True)),
+            postgresql_where=and_(is_available == True, is_reserved == False, is_blocked.isnot(True)),
+        ),
+    )
+
+class PricingRule(Base):
+    """
+    Price (or block) for a date range of a property, e.g. "2026-06-01..2026-08-31 at 140.00,
+    weekends 170.00". Expanded per night on read (utils/pricing_rules.py); a per-date
+    Availability row of the same night (override or reservation) always wins.
+    """
+    __tablename__ = 'pricing_rules'
+
+    id = Column(Integer, primary_key=True)
+    property_id = Column(Integer, ForeignKey('properties.id'), nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)  # inclusive (last night of the range)
+    price = Column(Numeric(10, 2))
+    weekend_price = Column(Numeric(10, 2))  # Friday and Saturday nights
+    is_blocked = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (Index('ix_pricing_rules_prop_range', 'property_id', 'start_date', 'end_date'),)
 
 class BookingStatus(enum.Enum):
     """ It holds the names of the three main reservation modes. """
@@ -122,6 +235,17 @@ class Booking(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     voucher_code = Column(String, unique=True)
     cancellation_policy = Column(String)
+    guest_info = Column(JSON)  # as sent with the booking, printed on the voucher
+
+    __table_args__ = (
+        # Guest/host listings: newest first, keyset-paginated on (created_at, id).
+        # Also the indexes of plain user_id / property_id lookups.
+        Index('ix_bookings_user_created', 'user_id', 'created_at', 'id'),
+        Index('ix_bookings_property_created', 'property_id', 'created_at', 'id'),
+        # The same listings filtered by ?status=, walked in order without skipping the other statuses
+        Index('ix_bookings_user_status_created', 'user_id', 'status', 'created_at', 'id'),
+        Index('ix_bookings_property_status_created', 'property_id', 'status', 'created_at', 'id'),
+    )
 
     # MANY TO ONE: Each booking is made by one user.
     user = relationship('User', back_populates='bookings')
@@ -1,14 +1,26 @@
-from datetime import date, datetime
+import heapq
+from datetime import date, datetime, timedelta
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from models import Availability, User, Property
+from models import Availability, User, Property, PricingRule
 from database import get_db
+from utils.availability import bump_calendar_version, calendar_changed
+from utils.availability_bulk import bulk_create, bulk_update, bulk_block, bulk_unblock
+from utils import ical
+from utils.pricing_rules import rules_for, expand_rules
 
 
 availability_bp = Blueprint('availability', __name__)
 
+# Longest range a single pricing rule may cover (nights)
+MAX_RULE_DAYS = 3 * 366
+# Longest window of the compact calendar format (nights)
+MAX_CALENDAR_DAYS = 3 * 366
+# How far ahead an imported ICS feed is applied (nights from today)
+ICS_IMPORT_MAX_DAYS = 3 * 366
+
 
 def parse_valid_dates(dates_dict):
     today = date.today()
@@ -69,41 +81,16 @@ def add_availability():
         if not prop:
             return jsonify({'error': 'Property not found or not owned by user'}), 403
 
-        valid_items, input_dates = parse_valid_dates(dates_dict)
-
-        # Query for check the existing dates in DB
-        existing = db.query(Availability.date).filter(
-            Availability.property_id == property_id,
-            Availability.date.in_(input_dates)
-        ).all()
-        # Converting query result(existing) to a set.
-        existing_dates = {e.date for e in existing}
-
-        # Preventing duplicates
-        results = []
-        for item in valid_items:
-            if item['parsed_date'] in existing_dates: # status code 201
-                results.append({
-                    'error': 'Availability already exists',
-                    'date': item['date_str']
-                })
-                continue
+        valid_items, _ = parse_valid_dates(dates_dict)
 
-            availability = Availability(
-                property_id=property_id,
-                date=item['parsed_date'],
-                price=item['price'],
-                is_available=item['is_available'],
-                is_blocked=item.get('is_blocked', False)
-            )
-            db.add(availability)
-            results.append({
-                'msg': 'Availability created',
-                'date': item['date_str'],
-                'is_available': item['is_available']
-            })
+        # One read of the existing dates, one multi-row insert (duplicates are reported)
+        results, written = bulk_create(db, property_id, valid_items)
 
+        if written:
+            bump_calendar_version(prop)
         db.commit()
+        if written:
+            calendar_changed(prop, written)
         return jsonify(results), 201
 
 
@@ -135,62 +122,56 @@ def bulk_update_availability():
         if not prop:
             return jsonify({'error': 'Property not found or not owned by user'}), 403
 
-        today = date.today()
-        update_results = []
-
-        for date_str, item in dates_dict.items():
-            try:
-                item_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            except ValueError:
-                update_results.append({'error': 'Invalid date format', 'date': date_str})
-                continue
-            # Past dates not allowed
-            if item_date < today:
-                update_results.append({'error': 'Cannot update past dates', 'date': date_str})
-                continue
-
-            availability = db.query(Availability).filter_by(
-                property_id=property_id,
-                date=item_date
-            ).first()
-
-            if not availability:
-                update_results.append({'error': 'Availability not found', 'date': date_str})
-                continue
-
-            if availability.is_reserved:
-                update_results.append({'error': 'Cannot update reserved date', 'date': date_str})
-                continue
-
-            # Apply updates
-            if 'price' in item:
-                try:
-                    availability.price = float(item['price'])
-                except ValueError:
-                    update_results.append({'error': 'Invalid price format', 'date': date_str})
-                    continue
-
-            if 'is_available' in item:
-                if not isinstance(item['is_available'], bool):
-                    update_results.append({'error': 'is_available must be boolean', 'date': date_str})
-                    continue
-                availability.is_available = item['is_available']
-
-            update_results.append({'msg': 'Availability updated', 'date': date_str})
+        # Validation in memory, one read of the affected rows, batched updates
+        update_results, written = bulk_update(db, property_id, dates_dict)
 
+        if written:
+            bump_calendar_version(prop)
         db.commit()
+        if written:
+            calendar_changed(prop, written)
         return jsonify(update_results), 200
 
 
 
+def _parse_window(from_str, to_str):
+    """ Returns (from, to, error) for the optional from/to query parameters (YYYY-MM-DD). """
+    try:
+        start = datetime.strptime(from_str, "%Y-%m-%d").date() if from_str else None
+        end = datetime.strptime(to_str, "%Y-%m-%d").date() if to_str else None
+    except ValueError:
+        return None, None, 'Invalid date format. Use YYYY-MM-DD.'
+    if start and end and end <= start:
+        return None, None, 'to must be after from'
+    return start, end, None
+
+
 @availability_bp.route('/availability/property/<int:property_id>', methods=['GET'])
 @jwt_required()
 def get_property_availability(property_id):
     """
     Return list of availability records for a given property.
     Only the host who owns the property can view them.
+    - from/to (YYYY-MM-DD, `to` not included) limit the nights returned.
+    - format=compact (from and to required) returns
+      {"property_id", "start_date", "prices", "availability", "reserved", "blocked"}: one price
+      per night (0.0 when there is no record) and one '1'/'0' character per night for each flag.
+    - The response carries an ETag derived from the property's calendar version; a request
+      with a matching If-None-Match gets a 304 without the calendar being read.
     """
     user_id = get_jwt_identity()
+    response_format = request.args.get('format', 'full').lower()
+    start, end, error = _parse_window(request.args.get('from'), request.args.get('to'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    if response_format not in ('full', 'compact'):
+        return jsonify({'error': 'format must be full or compact'}), 400
+    compact = (response_format == 'compact')
+    if compact and (start is None or end is None):
+        return jsonify({'error': 'from and to are required with format=compact'}), 400
+    if compact and (end - start).days > MAX_CALENDAR_DAYS:
+        return jsonify({'error': f'The window cannot be longer than {MAX_CALENDAR_DAYS} nights'}), 400
 
     with get_db() as db:
         prop = db.query(Property).filter_by(id=property_id, host_id=user_id).first()
@@ -199,23 +180,282 @@ def get_property_availability(property_id):
         if not prop:
             return jsonify({'error': 'Property not found or not owned by user'}), 403
 
-        # Getting availability records
-        availability_list = (
-            db.query(Availability)
-            .filter_by(property_id=property_id)
-            .order_by(Availability.date)
-            .all()
-        )
+        # Every calendar change bumps the version, so with the window and format it
+        # identifies the response's content
+        etag = f'cal-{property_id}-{prop.calendar_version}-{start or ""}-{end or ""}-{response_format}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
 
-        results = [
-            {
+        # Getting availability records
+        q = db.query(Availability).filter_by(property_id=property_id)
+        if start:
+            q = q.filter(Availability.date >= start)
+        if end:
+            q = q.filter(Availability.date < end)
+        availability_list = q.order_by(Availability.date).all()
+
+        results = {
+            avail.date: {
                 'id': avail.id,
                 'date': avail.date.isoformat(),
                 'price': float(avail.price),
                 'is_available': avail.is_available,
-                'is_reserved': avail.is_reserved
+                'is_reserved': avail.is_reserved,
+                'is_blocked': bool(avail.is_blocked)
             }
             for avail in availability_list
-        ]
+        }
+
+        # Nights priced by pricing rules only (no row of their own) have no id
+        rules = rules_for(db, [property_id], start, end)[property_id]
+        for day, (price, is_available) in expand_rules(rules, start, end).items():
+            if day not in results:
+                results[day] = {
+                    'id': None,
+                    'date': day.isoformat(),
+                    'price': price,
+                    'is_available': is_available,
+                    'is_reserved': False,
+                    'is_blocked': not is_available
+                }
+
+        if compact:
+            days = (end - start).days
+            prices = [0.0] * days
+            available, reserved, blocked = ['0'] * days, ['0'] * days, ['0'] * days
+            for day, night in results.items():
+                i = (day - start).days
+                prices[i] = night['price']
+                available[i] = '1' if night['is_available'] else '0'
+                reserved[i] = '1' if night['is_reserved'] else '0'
+                blocked[i] = '1' if night['is_blocked'] else '0'
+            body = {
+                'property_id': property_id,
+                'start_date': start.isoformat(),
+                'prices': prices,
+                'availability': ''.join(available),
+                'reserved': ''.join(reserved),
+                'blocked': ''.join(blocked)
+            }
+        else:
+            body = [results[day] for day in sorted(results)]
+
+        response = jsonify(body)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
+
+
+def _busy_nights(db, property_id, start, end=None):
+    """
+    Yields (date, 'Reserved' | 'Blocked') for the nights of [start, end) that can't be sold,
+    in date order: reserved, blocked or unavailable rows, and nights blocked by a rule
+    without a row of their own. Rows are streamed, not loaded at once.
+    """
+    rules = rules_for(db, [property_id], start, end)[property_id]
+    rule_blocks = sorted(day for day, (_, is_available) in expand_rules(rules, start, end).items()
+                         if not is_available)
+
+    q = db.query(
+        Availability.date, Availability.is_reserved, Availability.is_available, Availability.is_blocked
+    ).filter(Availability.property_id == property_id, Availability.date >= start)
+    if end:
+        q = q.filter(Availability.date < end)
+    rows = (
+        (day, 'Reserved' if is_reserved else 'Blocked' if is_blocked or not is_available else None)
+        for day, is_reserved, is_available, is_blocked in q.order_by(Availability.date).yield_per(1000)
+    )
+
+    # On equal dates the row comes first and wins over the rule.
+    last_row = None
+    for day, status in heapq.merge(rows, ((day, 'rule') for day in rule_blocks), key=lambda n: n[0]):
+        if status == 'rule':
+            if day != last_row:
+                yield day, 'Blocked'
+            continue
+        last_row = day
+        if status:
+            yield day, status
+
+
+@availability_bp.route('/availability/property/<int:property_id>/calendar.ics', methods=['GET'])
+@jwt_required()
+def export_calendar(property_id):
+    """
+    iCalendar export of the property's reserved and blocked nights (host only), from today
+    (or `from`) on, optionally up to `to` (not included). Consecutive nights with the same
+    status are one all-day event. The feed is streamed while the rows are read.
+    """
+    user_id = get_jwt_identity()
+    start, end, error = _parse_window(request.args.get('from'), request.args.get('to'))
+    if error:
+        return jsonify({'error': error}), 400
+    start = start or date.today()
+
+    with get_db() as db:
+        prop = db.query(Property).filter_by(id=property_id, host_id=user_id).first()
+        if not prop:
+            return jsonify({'error': 'Property not found or not owned by user'}), 403
+
+    def generate():
+        # Own session: the generator runs after the view has returned.
+        with get_db() as db:
+            yield from ical.generate(property_id, ical.group_nights(_busy_nights(db, property_id, start, end)))
+
+    response = Response(generate(), status=200, mimetype='text/calendar')
+    response.headers['Content-Disposition'] = f'attachment; filename=property-{property_id}.ics'
+    return response
+
+
+@availability_bp.route('/availability/property/<int:property_id>/calendar.ics', methods=['POST'])
+@jwt_required()
+def import_calendar(property_id):
+    """
+    Imports an iCalendar feed (request body, text/calendar) from another channel. The feed is
+    the source of truth for its window, today (or `from`) up to `to` (default and limit:
+    ICS_IMPORT_MAX_DAYS ahead): every night covered by a VEVENT is blocked, and blocks that
+    earlier imports set in the window and the feed no longer covers are cleared. Reserved
+    nights and the host's own blocks (bulk-update is_blocked) are left as they are.
+    The body is parsed line by line and written in batches, in one transaction.
+    """
+    user_id = get_jwt_identity()
+    start, end, error = _parse_window(request.args.get('from'), request.args.get('to'))
+    if error:
+        return jsonify({'error': error}), 400
+    today = date.today()
+    start = max(start or today, today)
+    end = min(end or date.max, today + timedelta(days=ICS_IMPORT_MAX_DAYS))
+    if end <= start:
+        return jsonify({'error': f'The window must end within {ICS_IMPORT_MAX_DAYS} nights from today'}), 400
+
+    with get_db() as db:
+        prop = db.query(Property).filter_by(id=property_id, host_id=user_id).first()
+        if not prop:
+            return jsonify({'error': 'Property not found or not owned by user'}), 403
+
+        blocked, covered = bulk_block(db, property_id, ical.iter_nights(ical.iter_events(request.stream), start, end))
+        unblocked = bulk_unblock(db, property_id, start, end, covered)
+
+        changed = blocked or unblocked
+        if changed:
+            bump_calendar_version(prop)
+        db.commit()
+        if changed:
+            calendar_changed(prop, None)
+        return jsonify({'msg': 'Calendar imported', 'nights_blocked': blocked, 'nights_unblocked': unblocked}), 200
+
+
+def _rule_to_dict(rule):
+    return {
+        'id': rule.id,
+        'property_id': rule.property_id,
+        'start_date': rule.start_date.isoformat(),
+        'end_date': rule.end_date.isoformat(),
+        'price': float(rule.price) if rule.price is not None else None,
+        'weekend_price': float(rule.weekend_price) if rule.weekend_price is not None else None,
+        'is_blocked': rule.is_blocked
+    }
+
+
+@availability_bp.route('/availability/rules', methods=['POST'])
+@jwt_required()
+def add_pricing_rule():
+    """
+    Hosts can price (or block) a whole date range with one rule instead of one
+    availability row per night, e.g.:
+    {"property_id": 1, "start_date": "2026-06-01", "end_date": "2026-08-31",
+     "price": 140.0, "weekend_price": 170.0}
+    {"property_id": 1, "start_date": "2026-07-04", "end_date": "2026-07-04", "is_blocked": true}
+    - end_date is the last night of the range (inclusive).
+    - Blocking rules win over price rules; among price rules the newest wins.
+    - Availability rows of the same nights (per-date overrides, reservations) win over rules.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json()
+
+    required = ('property_id', 'start_date', 'end_date')
+    if not data or any(k not in data for k in required):
+        return jsonify({'error': 'property_id, start_date and end_date are required'}), 400
+
+    try:
+        start_date = datetime.strptime(data['start_date'], "%Y-%m-%d").date()
+        end_date = datetime.strptime(data['end_date'], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+    if end_date < start_date:
+        return jsonify({'error': 'end_date must not be before start_date'}), 400
+    if end_date < date.today():
+        return jsonify({'error': 'Cannot define rules for past dates'}), 400
+    if (end_date - start_date).days >= MAX_RULE_DAYS:
+        return jsonify({'error': f'A rule cannot cover more than {MAX_RULE_DAYS} nights'}), 400
+
+    is_blocked = data.get('is_blocked', False)
+    if not isinstance(is_blocked, bool):
+        return jsonify({'error': 'is_blocked must be boolean'}), 400
+
+    try:
+        price = float(data['price']) if data.get('price') is not None else None
+        weekend_price = float(data['weekend_price']) if data.get('weekend_price') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid price format'}), 400
+    if price is None and not is_blocked:
+        return jsonify({'error': 'price is required unless is_blocked is true'}), 400
+
+    with get_db() as db:
+        prop = db.query(Property).filter_by(id=data['property_id'], host_id=user_id).first()
+        if not prop:
+            return jsonify({'error': 'Property not found or not owned by user'}), 403
+
+        rule = PricingRule(
+            property_id=prop.id,
+            start_date=start_date,
+            end_date=end_date,
+            price=price,
+            weekend_price=weekend_price,
+            is_blocked=is_blocked
+        )
+        db.add(rule)
+        bump_calendar_version(prop)
+        db.commit()
+        calendar_changed(prop, None)
+
+        return jsonify({'msg': 'Pricing rule created', 'rule': _rule_to_dict(rule)}), 201
+
+
+@availability_bp.route('/availability/property/<int:property_id>/rules', methods=['GET'])
+@jwt_required()
+def get_pricing_rules(property_id):
+    """ Return the pricing rules of a property (host only). """
+    user_id = get_jwt_identity()
+
+    with get_db() as db:
+        prop = db.query(Property).filter_by(id=property_id, host_id=user_id).first()
+        if not prop:
+            return jsonify({'error': 'Property not found or not owned by user'}), 403
+
+        rules = rules_for(db, [property_id])[property_id]
+        return jsonify([_rule_to_dict(rule) for rule in rules]), 200
+
+
+@availability_bp.route('/availability/rules/<int:rule_id>', methods=['DELETE'])
+@jwt_required()
+def delete_pricing_rule(rule_id):
+    """ Delete a pricing rule (host only). Nights already reserved keep their own rows. """
+    user_id = get_jwt_identity()
+
+    with get_db() as db:
+        rule = db.get(PricingRule, rule_id)
+        prop = db.query(Property).filter_by(id=rule.property_id, host_id=user_id).first() if rule else None
+        if not prop:
+            return jsonify({'error': 'Pricing rule not found or not owned by user'}), 404
+
+        db.delete(rule)
+        bump_calendar_version(prop)
+        db.commit()
+        calendar_changed(prop, None)
 
-        return jsonify(results), 200
\ No newline at end of file
+        return jsonify({'msg': 'Pricing rule deleted'}), 200
\ No newline at end of file
@@ -1,20 +1,33 @@
 
+import base64
+import io
 from datetime import datetime, date, timezone
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
-from utils.availability import check_property_availability
-from utils.pdf_generator import generate_voucher_pdf
-from models import User, Property, Booking
+from utils.availability import (
+    check_property_availability, property_lock, reserve_nights, bump_calendar_version, calendar_changed
+)
+from utils import vouchers
+from models import User, Property, Booking, BookingStatus
 from database import get_db
+from utils.idempotency import idempotent
 
 
 booking_bp = Blueprint('booking', __name__)
 
+# Page size of the booking listings (default, max)
+LIST_LIMIT = 20
+LIST_MAX_LIMIT = 100
+
 
 @booking_bp.route('/bookings', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_booking():
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -54,32 +67,201 @@ def create_booking():
         if not prop or not prop.is_approved:
             return jsonify({'error': 'Property not found or not approved'}), 404
 
-        success, availabilities, _ = check_property_availability(db, property_id, check_in, check_out)
-        if not success:
-            return jsonify({'error': 'Some dates are not available for booking'}), 409
-
-        total_price = sum([float(a.price) for a in availabilities])
-
-        booking = Booking(
-            user_id=user.id,
-            property_id=property_id,
-            check_in=check_in,
-            check_out=check_out,
-            total_price=total_price,
-            status='confirmed',
-            created_at = datetime.now(timezone.utc)
-        )
-        db.add(booking)
-
-        for a in availabilities:
-            a.is_reserved = True
-
-        db.commit()
-
-        pdf_buffer = generate_voucher_pdf(booking, guest_info, prop)
-        return send_file(
-            pdf_buffer,
-            as_attachment=True,
-            download_name=f"voucher_{booking.id}.pdf",
-            mimetype='application/pdf'
-        )
+        # Only bookings of the same property contend: row locks (Postgres) or a lock stripe
+        # (SQLite), plus a conditional UPDATE that never reserves a taken night.
+        with property_lock(db, prop.id):
+            success, availabilities, _ = check_property_availability(
+                db, property_id, check_in, check_out, for_update=True)
+            if not success:
+                return jsonify({'error': 'Some dates are not available for booking'}), 409
+
+            total_price = sum([float(a.price) for a in availabilities])
+
+            booking = Booking(
+                user_id=user.id,
+                property_id=property_id,
+                check_in=check_in,
+                check_out=check_out,
+                total_price=total_price,
+                status='confirmed',
+                created_at = datetime.now(timezone.utc),
+                voucher_code=vouchers.new_code(),
+                guest_info=guest_info
+            )
+            db.add(booking)
+
+            if not reserve_nights(db, availabilities):
+                db.rollback()
+                return jsonify({'error': 'Some dates are not available for booking'}), 409
+            bump_calendar_version(prop)
+            reserved = [(a.date, a.price, a.is_available, True, a.is_blocked) for a in availabilities]
+
+            try:
+                db.commit()
+            except IntegrityError:
+                # A night priced by a rule was booked concurrently (unique property_id + date)
+                db.rollback()
+                return jsonify({'error': 'Some dates are not available for booking'}), 409
+        calendar_changed(prop, reserved)
+
+        # The PDF is rendered in the background; GET /bookings/<id>/voucher serves it.
+        vouchers.submit(booking.id)
+        return jsonify({
+            'msg': 'Booking confirmed',
+            'booking_id': booking.id,
+            'voucher_code': booking.voucher_code,
+            'total_price': float(booking.total_price),
+            'voucher_url': f'/bookings/{booking.id}/voucher'
+        }), 201
+
+
+@booking_bp.route('/bookings/<int:booking_id>/voucher', methods=['GET'])
+@jwt_required()
+def get_voucher(booking_id):
+    """
+    Download the PDF voucher of a booking (the guest who booked or the property's host).
+    The stored file is served with an ETag; it is only rendered here if it is missing.
+    """
+    user_id = int(get_jwt_identity())
+
+    with get_db() as db:
+        booking = db.get(Booking, booking_id)
+        prop = db.get(Property, booking.property_id) if booking else None
+        if not booking or user_id not in (booking.user_id, prop.host_id):
+            return jsonify({'error': 'Booking not found'}), 404
+
+        # Bookings made before vouchers were stored get a code now
+        if not booking.voucher_code:
+            booking.voucher_code = vouchers.new_code()
+            db.commit()
+
+        # A booking's voucher never changes once rendered
+        etag = f'voucher-{booking.id}-{booking.voucher_code}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = send_file(
+                io.BytesIO(vouchers.get_pdf(booking, prop)),
+                as_attachment=True,
+                download_name=f"voucher_{booking.id}.pdf",
+                mimetype='application/pdf'
+            )
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def _encode_cursor(booking):
+    raw = f'{booking.created_at.isoformat()}|{booking.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """ (created_at, id) of the last booking of the previous page, or None if invalid. """
+    try:
+        created_at, booking_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(booking_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _list_bookings(q, include_guest):
+    """
+    One page of the bookings in `q`, newest first, with the listing query parameters:
+    limit, cursor (from the `X-Next-Cursor` header of the previous page), status,
+    from/to (stays overlapping [from, to)).
+    Keyset pagination on (created_at, id); the properties are joined in the same query.
+    The (user_id | property_id, [status,] created_at, id) indexes give that order; from/to
+    only filter the rows walked, there is no index ordered by created_at on the stay dates.
+    """
+    limit = max(1, min(request.args.get('limit', type=int) or LIST_LIMIT, LIST_MAX_LIMIT))
+    cursor = request.args.get('cursor', type=str)
+    status = request.args.get('status', type=str)
+
+    if status:
+        if status not in BookingStatus.__members__:
+            return jsonify({'error': f'status must be one of: {", ".join(BookingStatus.__members__)}'}), 400
+        q = q.filter(Booking.status == BookingStatus[status])
+
+    try:
+        for arg, condition in (('from', lambda d: Booking.check_out > d), ('to', lambda d: Booking.check_in < d)):
+            if request.args.get(arg):
+                q = q.filter(condition(datetime.strptime(request.args[arg], "%Y-%m-%d").date()))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+    if cursor:
+        after = _decode_cursor(cursor)
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        created_at, booking_id = after
+        q = q.filter(or_(
+            Booking.created_at < created_at,
+            and_(Booking.created_at == created_at, Booking.id < booking_id)
+        ))
+
+    bookings = (
+        q.options(joinedload(Booking.property).load_only(Property.title, Property.location))
+        .order_by(Booking.created_at.desc(), Booking.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+    items = []
+    for b in bookings:
+        item = {
+            'id': b.id,
+            'property_id': b.property_id,
+            'property_title': b.property.title,
+            'property_location': b.property.location,
+            'check_in': b.check_in.isoformat(),
+            'check_out': b.check_out.isoformat(),
+            'total_price': float(b.total_price),
+            'status': b.status.value,
+            'created_at': b.created_at.isoformat(),
+            'voucher_url': f'/bookings/{b.id}/voucher'
+        }
+        if include_guest:
+            item['user_id'] = b.user_id
+            item['guest_info'] = b.guest_info
+        items.append(item)
+
+    response = jsonify(items)
+    # A full page may have a next one; pass this value back as `cursor`.
+    if len(bookings) == limit:
+        response.headers['X-Next-Cursor'] = _encode_cursor(bookings[-1])
+    return response, 200
+
+
+@booking_bp.route('/bookings', methods=['GET'])
+@jwt_required()
+def list_bookings():
+    """
+    The current user's bookings, newest first (see _list_bookings for the parameters).
+    """
+    user_id = get_jwt_identity()
+
+    with get_db() as db:
+        return _list_bookings(db.query(Booking).filter(Booking.user_id == user_id), include_guest=False)
+
+
+@booking_bp.route('/host/bookings', methods=['GET'])
+@jwt_required()
+def list_host_bookings():
+    """
+    Bookings of all the host's properties (or of one, with property_id), newest first,
+    including the guest details (see _list_bookings for the other parameters).
+    """
+    user_id = get_jwt_identity()
+    property_id = request.args.get('property_id', type=int)
+
+    with get_db() as db:
+        user = db.query(User).get(user_id)
+        if not user or user.role != 'host':
+            return jsonify({'error': 'Access forbidden: user is not a host'}), 403
+
+        property_ids = db.query(Property.id).filter(Property.host_id == user.id)
+        if property_id is not None:
+            property_ids = property_ids.filter(Property.id == property_id)
+        q = db.query(Booking).filter(Booking.property_id.in_(property_ids.scalar_subquery()))
+        return _list_bookings(q, include_guest=True)
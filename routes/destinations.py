@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from sqlalchemy import func, desc
 from database import get_db
 from models import Property, Booking  # assumes Reservation has property_id FK to Property.id
+from utils import text_index
 import time
 
 destinations_bp = Blueprint('destinations', __name__)
@@ -139,8 +140,12 @@ def suggest_destinations():
         return resp, 200
 
     with get_db() as db:
-        # Case-insensitive substring match; ensure proper index (e.g., pg_trgm) in production
-        like = f"%{q}%"
+        # Case-insensitive substring match; resolved by the trigram index when possible
+        ids = text_index.match(db, location=q) if text_index.enabled() else None
+        if ids is not None:
+            location_filter = Property.id.in_(sorted(ids))
+        else:
+            location_filter = Property.location.ilike(f"%{q}%")
         rows = (
             db.query(
                 Property.location,
@@ -148,7 +153,7 @@ def suggest_destinations():
             )
             .filter(
                 Property.is_approved == True,
-                Property.location.ilike(like)
+                location_filter
             )
             .group_by(Property.location)
             .order_by(func.count(Property.id).desc(), Property.location.asc())
@@ -5,6 +5,9 @@ from sqlalchemy.exc import IntegrityError
 
 from models import Property, User
 from database import get_db
+from utils.idempotency import idempotent
+from utils import text_index
+from utils.property_cards import refresh_card
 
 
 properties_bp = Blueprint('properties', __name__)
@@ -12,6 +15,7 @@ properties_bp = Blueprint('properties', __name__)
 
 @properties_bp.route('/properties', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_property():
     """
     It creates 'Property' for who have the 'host' role.
@@ -52,11 +56,16 @@ def create_property():
         # IntegrityError handler (race condition)
         try:
             db.add(prop)
+            db.flush()
+            refresh_card(db, prop.id)
             db.commit()
         except IntegrityError:
             db.rollback()
             return jsonify({'msg': 'Duplicate property not allowed'}), 409
 
+        if text_index.enabled():
+            text_index.add_property(prop.id, title, location)
+
         return jsonify({'msg': 'Property created successfully', 'property_id': prop.id}), 201
 
 
@@ -1,6 +1,6 @@
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Property, User
+from models import PropertyCard, User
 from database import get_db
 
 property_bp = Blueprint('property', __name__)
@@ -16,18 +16,27 @@ def get_host_properties():
         if not user or user.role != 'host':
             return jsonify({'error': 'Access forbidden: user is not a host'}), 403
 
-        properties = db.query(Property).filter_by(host_id=user.id).all()
+        # Served from the property cards projection (one indexed read, no relationship loads)
+        cards = (
+            db.query(PropertyCard)
+            .filter(PropertyCard.host_id == user.id)
+            .order_by(PropertyCard.property_id)
+            .all()
+        )
 
         return jsonify({
             'host_id': user.id,
             'properties': [
                 {
-                    'id': p.id,
-                    'title': p.title,
-                    'location': p.location,
-                    'description': p.description,
-                    'is_activated': p.is_approved
+                    'id': c.property_id,
+                    'title': c.title,
+                    'location': c.location,
+                    'description': c.description,
+                    'is_activated': c.is_approved,
+                    'cover_url': c.cover_url,
+                    'thumb_url': c.thumb_url,
+                    'image_count': c.image_count
                 }
-                for p in properties
+                for c in cards
             ]
         }), 200
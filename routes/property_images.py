@@ -3,12 +3,13 @@ from __future__ import annotations
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from sqlalchemy import func
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
 from database import get_db
-from models import Property, PropertyImage
-from utils.images import process_image
+from models import Property, PropertyImage, ImageJob
 from config import Config
-from utils.r2 import r2_client  # Only used when USE_R2=true
+from utils import image_blobs, image_jobs, search_cache
+from utils.property_cards import refresh_card
+from utils.storage import storage
 from typing import Optional
 
 images_bp = Blueprint('images', __name__, url_prefix='/properties')
@@ -50,18 +51,14 @@ def _files_from_request():
     return files or []
 
 
-def _url_to_key(url: str) -> Optional[str]:
-    """
-    Extracts the object key from the public URL.
-    For R2 we use R2_PUBLIC_BASE_URL.
-    """
-    base = (Config.R2_PUBLIC_BASE_URL or '').rstrip('/')
-    if url and url.startswith(base + '/'):
-        return url[len(base) + 1:]
-    return None
+# ---------- routes ----------
 
+@images_bp.errorhandler(RequestEntityTooLarge)
+@images_bp.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    """ Uploads rejected while the body was streamed (utils/uploads.py). """
+    return jsonify({'error': e.description}), e.code
 
-# ---------- routes ----------
 
 @images_bp.route('/<int:property_id>/images', methods=['GET'])
 def list_images(property_id: int):
@@ -97,58 +94,73 @@ def list_images(property_id: int):
 @images_bp.route('/<int:property_id>/images', methods=['POST'])
 @jwt_required()
 def upload_images(property_id: int):
+    """
+    Uploads are spooled to disk and processed in the background: the response is
+    202 with a job id; poll GET /<property_id>/images/jobs/<job_id> for the result.
+    ?wait=true processes them within the request and returns the job's result
+    (200, 207 when some files failed, 400 when all did).
+    """
     user_id = _current_user_id()
     if user_id is None:
         return jsonify({'error': 'unauthorized'}), 401
 
-    files = request.files.getlist('files')
+    files = _files_from_request()
     if not files:
         return jsonify({'error': 'no files provided (use multipart/form-data with key "files")'}), 400
 
     if len(files) > Config.IMAGE_MAX_COUNT:
         return jsonify({"error": f"Too many files (max {Config.IMAGE_MAX_COUNT})"}), 400
 
-    succeeded, failed = [], []
+    wait = request.args.get('wait', 'false').lower() == 'true'
+
     with get_db() as db:
-        prop = db.get(Property, property_id)
-        if not prop:
-            return jsonify({"error": "Property not found"}), 404
-
-        base_sort = (
-                        db.query(func.coalesce(func.max(PropertyImage.sort_order), -1))
-                        .filter(PropertyImage.property_id == property_id)
-                        .scalar()
-                    ) + 1
-        has_any = db.query(PropertyImage.id).filter_by(property_id=property_id).first() is not None
-
-        for i, f in enumerate(files):
-            try:
-                meta = process_image(f, property_id)
-                img = PropertyImage(
-                    property_id=property_id,
-                    storage_key=meta.get("storage_key"),  # Medium version (relative) key for reference
-                    url=meta.get("url"),
-                    thumb_url=meta.get("thumb_url"),
-                    large_url=meta.get("large_url"),
-                    width=meta.get("width"),
-                    height=meta.get("height"),
-                    bytes=meta.get("bytes"),
-                    format=meta.get("format"),
-                    is_cover=False,
-                    sort_order=base_sort + i,
-                )
-                if not has_any and i == 0:
-                    img.is_cover = True
-                db.add(img)
-                db.commit()
-                succeeded.append({"id": img.id, "url": img.url})
-                has_any = True
-            except Exception as e:
-                db.rollback()
-                failed.append({"filename": getattr(f, "filename", None), "error": str(e)})
+        prop, err = _ensure_owner(db, property_id, user_id)
+        if err:
+            return jsonify({'error': err[0]}), err[1]
+
+        if not wait and not image_jobs.has_capacity():
+            return jsonify({'error': 'Too many uploads in progress, retry later'}), 503
 
+        job = image_jobs.create_job(db, property_id, user_id, files)
+        job_id = job.id
+
+    status_url = f'/properties/{property_id}/images/jobs/{job_id}'
+    if not wait:
+        image_jobs.submit(job_id)
+        response = jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url})
+        response.headers['Location'] = status_url
+        return response, 202
+
+    image_jobs.run(job_id)
+    with get_db() as db:
+        result = image_jobs.job_to_dict(db.get(ImageJob, job_id))
+    succeeded, failed = result['succeeded'], result['failed']
     status = 207 if failed and succeeded else (200 if succeeded else 400)
-    return jsonify({"succeeded": succeeded, "failed": failed}), status
+    return jsonify({"succeeded": succeeded, "failed": failed, "metrics": result['metrics']}), status
+
+
+@images_bp.route('/<int:property_id>/images/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_upload_job(property_id: int, job_id: str):
+    """
+    Status of a background upload: per-file progress plus the succeeded/failed lists.
+    A job whose worker was lost (see image_jobs.fail_stale) is reported failed.
+    """
+    user_id = _current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'unauthorized'}), 401
+
+    with get_db() as db:
+        prop, err = _ensure_owner(db, property_id, user_id)
+        if err:
+            return jsonify({'error': err[0]}), err[1]
+
+        job = db.get(ImageJob, job_id)
+        if not job or job.property_id != property_id:
+            return jsonify({'error': 'job not found'}), 404
+        if job.status in ('queued', 'running') and image_jobs.fail_stale(db, [job_id]):
+            job = db.get(ImageJob, job_id)  # reloaded: the commit expired it
+        return jsonify(image_jobs.job_to_dict(job)), 200
 
 
 @images_bp.route('/<int:property_id>/images/<int:image_id>', methods=['PATCH'])
@@ -188,7 +200,9 @@ def update_image(property_id: int, image_id: int):
         if 'alt_text' in payload:
             img.alt_text = (payload['alt_text'] or '')[:256]
 
+        refresh_card(db, property_id)
         db.commit()
+        search_cache.invalidate_property(property_id)
         return jsonify({'ok': True}), 200
 
 
@@ -210,15 +224,16 @@ def delete_image(property_id: int, image_id: int):
         if not img:
             return jsonify({'error':'image not found'}), 404
 
-        s3 = r2_client()
-        for field in ['url','thumb_url','large_url']:
-            k = _url_to_key(getattr(img, field))
-            if k:
-                try:
-                    s3.delete_object(Bucket=Config.R2_BUCKET_NAME, Key=k)
-                except Exception:
-                    pass
+        if img.digest:
+            # Shared with identical uploads: removed once the last image using it is gone
+            keys = image_blobs.release(db, img.digest)
+        else:
+            keys = [k for k in (storage().key_for_url(getattr(img, field))
+                                for field in ['url', 'thumb_url', 'large_url']) if k]
 
         db.delete(img)
+        refresh_card(db, property_id)
         db.commit()
+        image_blobs.delete_objects(keys)
+        search_cache.invalidate_property(property_id)
         return jsonify({'ok': True}), 200
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+
+from flask import Blueprint, request, jsonify
+
+from database import get_db
+from models import Property
+from utils.search import night_map
+
+
+quotes_bp = Blueprint('quotes', __name__)
+
+# Stays per request
+MAX_QUOTE_ITEMS = 100
+# Longest stay, and longest span between the first check-in and the last check-out (nights)
+MAX_QUOTE_NIGHTS = 366
+MAX_QUOTE_SPAN_DAYS = 3 * 366
+
+
+def _parse_item(item, today):
+    """ Returns (property_id, check_in, check_out, None) or (None, None, None, error). """
+    if not isinstance(item, dict) or not all(item.get(k) for k in ('property_id', 'check_in', 'check_out')):
+        return None, None, None, 'property_id, check_in and check_out are required'
+    try:
+        check_in = datetime.strptime(item['check_in'], "%Y-%m-%d").date()
+        check_out = datetime.strptime(item['check_out'], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None, None, None, 'Invalid date format. Use YYYY-MM-DD'
+    if check_in >= check_out:
+        return None, None, None, 'Check-out must be after check-in'
+    if check_in < today:
+        return None, None, None, 'Check-in date cannot be in the past'
+    if (check_out - check_in).days > MAX_QUOTE_NIGHTS:
+        return None, None, None, f'A stay cannot be longer than {MAX_QUOTE_NIGHTS} nights'
+    # An int, or its digits as a string (as POST /bookings accepts it)
+    property_id = item['property_id']
+    if isinstance(property_id, str) and property_id.strip().isdigit():
+        property_id = int(property_id)
+    if not isinstance(property_id, int) or isinstance(property_id, bool):
+        return None, None, None, 'property_id must be an integer'
+    return property_id, check_in, check_out, None
+
+
+@quotes_bp.route('/quotes', methods=['POST'])
+def create_quotes():
+    """
+    Prices many stays at once (wishlist, cart), with the same rules as a booking:
+    every night must be bookable (utils/search.BOOKABLE, as checked by POST /bookings), and
+    the total is the sum of the nightly prices.
+    Body: {"stays": [{"property_id": 1, "check_in": "2025-10-01", "check_out": "2025-10-04"}, ...]}
+    The nights of all stays are read in one fetch. One result per stay, in request order:
+    {
+      "property_id": 1, "check_in": "2025-10-01", "check_out": "2025-10-04",
+      "available": true, "total_price": 36000.0,
+      "nights": {"2025-10-01": {"price": 12000.0, "is_available": true}, ...}
+    }
+    total_price is null when a night is not available; invalid stays get {"error": ...}.
+    """
+    data = request.get_json(silent=True)
+    stays = data.get('stays') if isinstance(data, dict) else None
+
+    if not isinstance(stays, list) or not stays:
+        return jsonify({'error': 'stays is required (a list of property_id, check_in, check_out)'}), 400
+    if len(stays) > MAX_QUOTE_ITEMS:
+        return jsonify({'error': f'At most {MAX_QUOTE_ITEMS} stays per request'}), 400
+
+    today = date.today()
+    parsed = [_parse_item(item, today) for item in stays]
+    valid = [p for p in parsed if p[3] is None]
+
+    nights = {}
+    approved = set()
+    if valid:
+        start = min(p[1] for p in valid)
+        end = max(p[2] for p in valid)
+        if (end - start).days > MAX_QUOTE_SPAN_DAYS:
+            return jsonify({'error': f'All stays must fall within {MAX_QUOTE_SPAN_DAYS} days'}), 400
+
+        with get_db() as db:
+            # The calendar versions let night_map skip index entries another worker made stale
+            versions = dict(
+                db.query(Property.id, Property.calendar_version).filter(
+                    Property.id.in_({p[0] for p in valid}),
+                    Property.is_approved == True
+                )
+            )
+            approved = set(versions)
+            nights = night_map(db, sorted(approved), start, end, versions)
+
+    results = []
+    for item, (property_id, check_in, check_out, error) in zip(stays, parsed):
+        if error is None and property_id not in approved:
+            error = 'Property not found or not approved'
+        if error is not None:
+            results.append({'error': error, 'stay': item})
+            continue
+
+        by_date = nights[property_id]
+        breakdown = OrderedDict()
+        total_price = 0.0
+        available = True
+        for i in range((check_out - check_in).days):
+            day = check_in + timedelta(days=i)
+            price, is_available = by_date.get(day, (None, False))
+            breakdown[day.isoformat()] = {'price': price, 'is_available': is_available}
+            if is_available:
+                total_price += price
+            else:
+                available = False
+
+        result = OrderedDict()
+        result['property_id'] = property_id
+        result['check_in'] = check_in.isoformat()
+        result['check_out'] = check_out.isoformat()
+        result['available'] = available
+        result['total_price'] = total_price if available else None
+        result['nights'] = breakdown
+        results.append(result)
+
+    return jsonify(results), 200
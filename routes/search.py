@@ -4,13 +4,26 @@ from flask import Response
 import json
 from collections import OrderedDict
 from datetime import datetime, timedelta
-from models import Property, Availability
 from database import get_db
+from utils.search import iter_page, night_map, cover_cards, cover_urls, SORTS, iter_candidates, window_arrays, cheapest_stays
+from utils import search_cache
 
 
 
 search_bp = Blueprint('search', __name__)
 
+# Properties evaluated per round trip when streaming (stream=true)
+STREAM_CHUNK_SIZE = 20
+
+# Item keys per response format (the `fields` parameter selects among them)
+FULL_FIELDS = ('cover_url', 'location', 'property_id', 'title', 'total_night', 'total_price',
+               'available_from', 'available_to', 'dates')
+COMPACT_FIELDS = FULL_FIELDS[:-1] + ('start_date', 'prices', 'availability')
+NIGHT_FIELDS = {'dates', 'start_date', 'prices', 'availability'}
+
+# Longest window accepted by /search/flexible
+FLEXIBLE_MAX_WINDOW_DAYS = 366
+
 
 @search_bp.route('/search', methods=['GET'])
 def search_properties():
@@ -21,6 +34,14 @@ def search_properties():
         location, property_id, title, total_night, total_price, available_from, available_to, dates
     - The `dates` key is at the end and contains the price/status of each night.
     - If include_partial=false (default) only returns if all nights are available.
+    - Pagination: `limit` plus `cursor` (property_id of the last item of the previous page).
+      Full pages carry the next cursor in the `X-Next-Cursor` header. `offset` still works.
+    - stream=true sends the items as they are evaluated instead of building the whole list.
+    - format=compact replaces `dates` with `start_date`, `prices` (one per night, 0.0 when
+      there is no record) and `availability` (one '1'/'0' character per night).
+    - min_price/max_price filter on total_price; sort=total_price|price_per_night orders the
+      results by that value (ascending, offset/limit pagination only).
+    - fields=a,b,... keeps only those keys (e.g. fields=property_id,total_price drops `dates`).
     Example output for each item:
     {
       "location": "Tehran",
@@ -42,6 +63,13 @@ def search_properties():
     include_partial = (request.args.get('include_partial', 'false').lower() == 'true')
     limit = request.args.get('limit', type=int) or 50
     offset = request.args.get('offset', type=int) or 0
+    cursor = request.args.get('cursor', type=int)
+    stream = (request.args.get('stream', 'false').lower() == 'true')
+    response_format = request.args.get('format', 'full').lower()
+    fields_str = request.args.get('fields', type=str)
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    sort = request.args.get('sort', type=str)
     check_in_str = request.args.get('check_in', type=str)
     check_out_str = request.args.get('check_out', type=str)
 
@@ -59,74 +87,211 @@ def search_properties():
     if check_out <= check_in:
         return jsonify({'error': 'check_out must be after check_in'}), 400
 
+    if sort is not None and sort not in SORTS:
+        return jsonify({'error': f'sort must be one of: {", ".join(SORTS)}'}), 400
+    if sort is not None and cursor is not None:
+        return jsonify({'error': 'cursor is not supported with sort; use offset'}), 400
+
+    if response_format not in ('full', 'compact'):
+        return jsonify({'error': 'format must be full or compact'}), 400
+    compact = (response_format == 'compact')
+
+    allowed_fields = COMPACT_FIELDS if compact else FULL_FIELDS
+    if fields_str:
+        fields = {f.strip() for f in fields_str.split(',') if f.strip()}
+        unknown = fields - set(allowed_fields)
+        if unknown:
+            return jsonify({'error': f'Unknown fields: {", ".join(sorted(unknown))}',
+                            'allowed': list(allowed_fields)}), 400
+    else:
+        fields = set(allowed_fields)
+    want_nights = bool(fields & NIGHT_FIELDS)
+
+    # The cursor replaces offset; offset is kept for older clients.
+    if cursor is not None:
+        offset = 0
+
     total_nights = (check_out - check_in).days
 
+    days = [check_in + timedelta(days=i) for i in range(total_nights)]
+    day_keys = [d.strftime('%Y-%m-%d') for d in days]
+
+    def evaluate(db, chunk_size, card_versions=None):
+        """
+        Yields (property_id, calendar_version, item) of the page, one chunk of properties at a time.
+        card_versions, if given, receives the card updated_at of the covers shown.
+        """
+        chunks = iter_page(
+            db, check_in, check_out,
+            location=location, title=title, include_partial=include_partial,
+            min_price=min_price, max_price=max_price, sort=sort,
+            after_id=cursor, offset=offset, limit=limit, chunk_size=chunk_size,
+        )
+        for rows in chunks:
+            page_ids = [row[0] for row in rows]
+            nights = night_map(db, page_ids, check_in, check_out,
+                               {row[0]: row[5] for row in rows}) if want_nights else {}
+            covers = cover_cards(db, page_ids) if 'cover_url' in fields else {}
+            if card_versions is not None:
+                card_versions.update((pid, covers[pid][1] if pid in covers else None) for pid in page_ids)
+
+            for pid, p_title, p_location, _, total_price, version in rows:
+                item = OrderedDict()
+                item['cover_url'] = covers[pid][0] if pid in covers else None
+                item['location'] = p_location
+                item['property_id'] = pid
+                item['title'] = p_title
+                item['total_night'] = total_nights
+                item['total_price'] = float(total_price)
+                item['available_from'] = check_in_str
+                item['available_to'] = check_out_str
+
+                if want_nights:
+                    by_date = nights[pid]
+                    per_night = [by_date.get(d, (0.0, False)) for d in days]
+                    if compact:
+                        item['start_date'] = check_in_str
+                        item['prices'] = [price_val for price_val, _ in per_night]
+                        item['availability'] = ''.join('1' if is_avail else '0' for _, is_avail in per_night)
+                    else:
+                        item['dates'] = {
+                            key: {'price': price_val, 'is_available': is_avail}
+                            for key, (price_val, is_avail) in zip(day_keys, per_night)
+                        }
+
+                if len(fields) != len(item):
+                    item = OrderedDict((k, v) for k, v in item.items() if k in fields)
+                yield pid, version, item
+
+    if stream:
+        def generate():
+            # Own session: the generator runs after the view has returned.
+            with get_db() as db:
+                yield '['
+                for i, (_, _, item) in enumerate(evaluate(db, chunk_size=STREAM_CHUNK_SIZE)):
+                    yield (',' if i else '') + json.dumps(item, ensure_ascii=False, sort_keys=False)
+                yield ']'
+
+        return Response(generate(), status=200, mimetype='application/json')
+
+    cache_key = None
+    if search_cache.enabled():
+        cache_key = search_cache.make_key(
+            location=location, title=title, check_in=check_in, check_out=check_out,
+            include_partial=include_partial, min_price=min_price, max_price=max_price, sort=sort,
+            cursor=cursor, offset=offset, limit=limit,
+            format=response_format, fields=tuple(sorted(fields)),
+        )
+
+    with get_db() as db:
+        cached = search_cache.get(db, cache_key) if cache_key else None
+        if cached:
+            body, next_cursor = cached
+        else:
+            # The page's covers come from the property cards: hits are re-checked against them too
+            card_versions = {} if 'cover_url' in fields else None
+            evaluated = list(evaluate(db, chunk_size=limit, card_versions=card_versions))
+            body = json.dumps([item for _, _, item in evaluated], ensure_ascii=False, sort_keys=False)
+            # A full page may have a next one; pass this value back as `cursor`.
+            next_cursor = str(evaluated[-1][0]) if len(evaluated) == limit and not sort else None
+            if cache_key:
+                search_cache.put(cache_key, body, next_cursor, {pid: version for pid, version, _ in evaluated},
+                                 card_versions)
+
+    response = Response(body, status=200, mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@search_bp.route('/search/flexible', methods=['GET'])
+def search_flexible():
+    """
+    Flexible-dates search: "a stay of N nights sometime between window_start and window_end".
+    Each candidate's availability is loaded once for the whole window and every possible
+    start date is evaluated with prefix sums (sliding windows).
+    - Query params: window_start, window_end (YYYY-MM-DD, end excluded), nights (mandatory),
+      location, title, per_property (cheapest options per property, default 3, max 10),
+      limit (default 20) and cursor (property_id, next one in the `X-Next-Cursor` header).
+    - Only properties with at least one fully bookable stay are returned.
+    Example output for each item:
+    {
+      "cover_url": null,
+      "location": "Tehran",
+      "property_id": 1,
+      "title": "ehsan Flatt 02",
+      "nights": 5,
+      "options": [
+        {"check_in": "2025-10-03", "check_out": "2025-10-08", "total_price": 60000.0},
+        ...
+      ]
+    }
+    """
+    location = request.args.get('location', type=str)
+    title = request.args.get('title', type=str)
+    nights = request.args.get('nights', type=int)
+    per_property = request.args.get('per_property', type=int) or 3
+    limit = request.args.get('limit', type=int) or 20
+    cursor = request.args.get('cursor', type=int)
+    window_start_str = request.args.get('window_start', type=str)
+    window_end_str = request.args.get('window_end', type=str)
+
+    if not window_start_str or not window_end_str or not nights:
+        return jsonify({'error': 'window_start, window_end (YYYY-MM-DD) and nights are required'}), 400
+
+    try:
+        window_start = datetime.strptime(window_start_str, '%Y-%m-%d').date()
+        window_end = datetime.strptime(window_end_str, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD.'}), 400
+
+    window_days = (window_end - window_start).days
+    if nights < 1:
+        return jsonify({'error': 'nights must be at least 1'}), 400
+    if window_days < nights:
+        return jsonify({'error': 'The window must be at least `nights` long'}), 400
+    if window_days > FLEXIBLE_MAX_WINDOW_DAYS:
+        return jsonify({'error': f'The window cannot exceed {FLEXIBLE_MAX_WINDOW_DAYS} days'}), 400
+
+    per_property = max(1, min(per_property, 10))
+    stay = timedelta(days=nights)
+
     results = []
     with get_db() as db:
-        q = db.query(Property)
-        if location:
-            q = q.filter(Property.location.ilike(f"%{location.strip()}%"))
-        if title:
-            q = q.filter(Property.title.ilike(f"%{title.strip()}%"))
-
-        props = q.offset(offset).limit(limit).all()
-
-        for p in props:
-            # Only nights in range (check_in, check_out)
-            recs = (
-                db.query(Availability)
-                .filter(
-                    Availability.property_id == p.id,
-                    Availability.date >= check_in,
-                    Availability.date < check_out,
-                )
-                .all()
-            )
-            by_date = {r.date: r for r in recs}
-
-            dates_map = {}
-            all_nights_available = True
-            total_price = 0.0
-
-            cur = check_in
-            while cur < check_out:
-                r = by_date.get(cur)
-                if r:
-                    is_avail = bool(r.is_available and not r.is_reserved and not r.is_blocked)
-                    price_val = float(r.price)
-                else:
-                    is_avail = False
-                    price_val = 0.0
-
-                if is_avail:
-                    total_price += price_val
-                else:
-                    all_nights_available = False
-
-                dates_map[cur.strftime('%Y-%m-%d')] = {
-                    'price': price_val,
-                    'is_available': is_avail
-                }
-                cur += timedelta(days=1)
-
-            # Default behavior: Return only when all nights are available.
-            if not include_partial and not all_nights_available:
-                continue
-            item = OrderedDict()
-            cover = next((im for im in p.images if im.is_cover), None)
-            item['cover_url'] = cover.url if cover else (p.images[0].url if p.images else None)
-            item['location'] = p.location
-            item['property_id'] = p.id
-            item['title'] = p.title
-            item['total_night'] = total_nights
-            item['total_price'] = total_price
-            item['available_from'] = check_in_str
-            item['available_to'] = check_out_str
-
-            item['dates'] = dates_map
-
-            results.append(item)
-
-        body = json.dumps(results, ensure_ascii=False, sort_keys=False)
-
-    return Response(body, status=200, mimetype='application/json')
\ No newline at end of file
+        for candidates in iter_candidates(db, location, title, after_id=cursor):
+            arrays = window_arrays(db, candidates, window_start, window_end)
+
+            found = []
+            for pid, p_title, p_location, _ in candidates:
+                prices, bookable = arrays[pid]
+                options = cheapest_stays(prices, bookable, nights, per_property)
+                if options:
+                    found.append((pid, p_title, p_location, options))
+                    if len(results) + len(found) == limit:
+                        break
+
+            covers = cover_urls(db, [f[0] for f in found])
+            for pid, p_title, p_location, options in found:
+                item = OrderedDict()
+                item['cover_url'] = covers[pid][0] if pid in covers else None
+                item['location'] = p_location
+                item['property_id'] = pid
+                item['title'] = p_title
+                item['nights'] = nights
+                item['options'] = [
+                    {
+                        'check_in': (window_start + timedelta(days=i)).isoformat(),
+                        'check_out': (window_start + timedelta(days=i) + stay).isoformat(),
+                        'total_price': total,
+                    }
+                    for i, total in options
+                ]
+                results.append(item)
+            if len(results) == limit:
+                break
+
+    body = json.dumps(results, ensure_ascii=False, sort_keys=False)
+    response = Response(body, status=200, mimetype='application/json')
+    if len(results) == limit:
+        response.headers['X-Next-Cursor'] = str(results[-1]['property_id'])
+    return response
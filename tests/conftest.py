@@ -0,0 +1,169 @@
+"""
+Shared fixtures: the app runs against a throwaway SQLite database (configured through the
+environment before anything imports config.py), with vouchers, spooled uploads and local
+image storage under the same temporary directory. The `s3` fixture switches image storage
+to R2, served by a local S3 stand-in.
+"""
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TMP = tempfile.mkdtemp(prefix='dream_stay_tests_')
+
+os.environ.update(
+    SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(_TMP, 'test.db'),
+    SECRET_KEY='test-secret-key-' + 'x' * 32,
+    VOUCHER_DIR=os.path.join(_TMP, 'vouchers'),
+    IMAGE_SPOOL_DIR=os.path.join(_TMP, 'spool'),
+    IMAGE_LOCAL_DIR=os.path.join(_TMP, 'media'),
+    IMAGE_ENCODE_WORKERS='0',
+    USE_R2='false',
+)
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app():
+    import database
+    database.engine.echo = False
+    from app import app as flask_app
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _login(client, role):
+    email = f'{role}-{uuid.uuid4().hex[:8]}@example.com'
+    client.post('/register', json={'email': email, 'password': 'secret', 'role': role})
+    token = client.post('/login', json={'email': email, 'password': 'secret'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def host(client):
+    """ Auth headers of a new host. """
+    return _login(client, 'host')
+
+
+@pytest.fixture
+def guest(client):
+    """ Auth headers of a new guest. """
+    return _login(client, 'guest')
+
+
+def _day(n):
+    return (date.today() + timedelta(days=n)).isoformat()
+
+
+@pytest.fixture
+def day():
+    """ day(n): the date n days from today, as YYYY-MM-DD. """
+    return _day
+
+
+@pytest.fixture
+def make_property(client, host):
+    """ Creates a property of `host` priced `price` per night for nights 1..nights ahead. """
+    def make(nights=10, price=100):
+        r = client.post('/properties', json={'title': f'Flat {uuid.uuid4().hex[:8]}', 'location': 'Lisbon'},
+                        headers=host)
+        property_id = r.get_json()['property_id']
+        if nights:
+            client.post('/availability', headers=host, json={
+                'property_id': property_id,
+                'dates': {_day(n): {'price': price, 'is_available': True} for n in range(1, nights + 1)},
+            })
+        return property_id
+    return make
+
+
+class S3StandIn:
+    """
+    Local S3 stand-in: an HTTP server answering the path-style PUT/GET/DELETE object calls
+    of boto3 from memory. `objects` maps keys to (body, headers); `connections` holds the
+    client address of every request, to see how many connections the client opened.
+    """
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.objects = {}
+        self.requests = []
+        self.connections = set()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _key(self):
+                prefix = f'/{standin.bucket}/'
+                assert self.path.startswith(prefix), self.path
+                return self.path[len(prefix):]
+
+            def _reply(self, status, body=b'', headers=()):
+                standin.requests.append((self.command, self.path))
+                standin.connections.add(self.client_address)
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                standin.objects[self._key()] = (body, dict(self.headers))
+                self._reply(200, headers=[('ETag', '"stand-in"')])
+
+            def do_GET(self):
+                found = standin.objects.get(self._key())
+                if found is None:
+                    self._reply(404)
+                else:
+                    self._reply(200, found[0], [('Content-Type', found[1].get('Content-Type', ''))])
+
+            def do_DELETE(self):
+                standin.objects.pop(self._key(), None)
+                self._reply(204)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.endpoint = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def s3(app, monkeypatch):
+    """ Images stored in R2 (USE_R2=true), served by an S3StandIn. """
+    from botocore.config import Config as BotoCfg
+    from config import Config
+    import utils.r2
+    import utils.storage
+
+    standin = S3StandIn('dream-stay')
+    for name, value in (('USE_R2', True), ('R2_ENDPOINT', standin.endpoint), ('R2_BUCKET_NAME', 'dream-stay'),
+                        ('R2_PUBLIC_BASE_URL', 'https://cdn.example.com'),
+                        ('R2_ACCESS_KEY_ID', 'test'), ('R2_SECRET_ACCESS_KEY', 'test')):
+        monkeypatch.setattr(Config, name, value)
+    # The stand-in has no per-bucket host names
+    monkeypatch.setattr(utils.r2, '_BOTO_CFG', utils.r2._BOTO_CFG.merge(BotoCfg(s3={'addressing_style': 'path'})))
+    monkeypatch.setattr(utils.r2, '_client', None)
+    monkeypatch.setattr(utils.storage, '_storage', None)
+    yield standin
+    standin.close()
@@ -0,0 +1,83 @@
+"""
+Overlapping bookings of one property from many threads: every night is sold at most once,
+the losers get 409.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+
+import routes.booking
+from database import get_db
+from models import Availability, Booking, BookingStatus
+
+
+THREADS = 32
+REQUESTS = 200
+NIGHTS = 30
+GUEST_INFO = {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'}
+
+
+@contextmanager
+def _no_lock(db, property_id):
+    yield
+
+
+@pytest.mark.parametrize('striped_lock', [True, False], ids=['striped-lock', 'conditional-update-only'])
+def test_overlapping_bookings_never_overbook(app, make_property, guest, day, monkeypatch, striped_lock):
+    if not striped_lock:
+        # Only the conditional UPDATE (rowcount check) guards the nights, as across processes
+        monkeypatch.setattr(routes.booking, 'property_lock', _no_lock)
+    property_id = make_property(nights=NIGHTS)
+
+    rng = random.Random(15)
+    stays = []
+    for _ in range(REQUESTS):
+        start = rng.randint(1, NIGHTS - 1)
+        stays.append((start, min(NIGHTS + 1, start + rng.randint(1, 4))))
+
+    statuses = []
+    barrier = threading.Barrier(THREADS)
+
+    def worker(chunk):
+        client = app.test_client()
+        barrier.wait()
+        for start, end in chunk:
+            r = client.post('/bookings', headers=guest, json={
+                'property_id': property_id, 'check_in': day(start), 'check_out': day(end),
+                'guest_info': GUEST_INFO,
+            })
+            statuses.append(r.status_code)
+
+    threads = [threading.Thread(target=worker, args=(stays[i::THREADS],)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert set(statuses) <= {201, 409}, statuses
+    assert statuses.count(201) > 0
+
+    with get_db() as db:
+        bookings = db.query(Booking).filter(
+            Booking.property_id == property_id, Booking.status == BookingStatus.confirmed
+        ).all()
+        reserved = {
+            d for (d,) in db.query(Availability.date).filter(
+                Availability.property_id == property_id, Availability.is_reserved == True
+            )
+        }
+
+    # One winner per night
+    sold = {}
+    for b in bookings:
+        night = b.check_in
+        while night < b.check_out:
+            assert night not in sold, f'{night} sold to bookings {sold[night]} and {b.id}'
+            sold[night] = b.id
+            night += timedelta(days=1)
+    assert len(bookings) == statuses.count(201)
+    assert set(sold) == reserved
+    assert all(date.today() < night for night in sold)
@@ -0,0 +1,69 @@
+"""
+Calendar (iCalendar) import: the feed owns the blocks it created, not the host's.
+"""
+from datetime import date, timedelta
+
+from database import get_db
+from models import Availability
+
+
+GUEST_INFO = {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'}
+
+
+def _feed(*nights):
+    events = []
+    for n in nights:
+        start = date.today() + timedelta(days=n)
+        events += ['BEGIN:VEVENT', f'UID:{n}@other-channel', f'DTSTART;VALUE=DATE:{start:%Y%m%d}',
+                   f'DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}', 'END:VEVENT']
+    return '\r\n'.join(['BEGIN:VCALENDAR', 'VERSION:2.0', *events, 'END:VCALENDAR', ''])
+
+
+def _import(client, host, property_id, *nights):
+    r = client.post(f'/availability/property/{property_id}/calendar.ics', headers=host,
+                    data=_feed(*nights), content_type='text/calendar')
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+def _blocked(property_id):
+    with get_db() as db:
+        return {(d - date.today()).days for (d,) in db.query(Availability.date).filter(
+            Availability.property_id == property_id, Availability.is_blocked == True)}
+
+
+def test_reimport_clears_only_its_own_blocks(client, make_property, host, guest, day):
+    property_id = make_property(nights=10)
+    r = client.put('/availability/bulk-update', headers=host, json={
+        'property_id': property_id, 'dates': {day(5): {'is_blocked': True}},
+    })
+    assert r.status_code == 200
+
+    assert _import(client, host, property_id, 3, 8)['nights_blocked'] == 2
+    assert _blocked(property_id) == {3, 5, 8}
+
+    # The feed dropped night 3: that block goes, the host's block on night 5 stays
+    result = _import(client, host, property_id, 8)
+    assert (result['nights_blocked'], result['nights_unblocked']) == (0, 1)
+    assert _blocked(property_id) == {5, 8}
+
+    r = client.post('/bookings', headers=guest, json={
+        'property_id': property_id, 'check_in': day(5), 'check_out': day(6), 'guest_info': GUEST_INFO,
+    })
+    assert r.status_code == 409
+    r = client.post('/bookings', headers=guest, json={
+        'property_id': property_id, 'check_in': day(3), 'check_out': day(4), 'guest_info': GUEST_INFO,
+    })
+    assert r.status_code == 201
+
+
+def test_host_takes_over_an_imported_block(client, make_property, host, day):
+    property_id = make_property(nights=10)
+    _import(client, host, property_id, 4)
+    r = client.put('/availability/bulk-update', headers=host, json={
+        'property_id': property_id, 'dates': {day(4): {'is_blocked': True}},
+    })
+    assert r.status_code == 200
+
+    assert _import(client, host, property_id)['nights_unblocked'] == 0
+    assert _blocked(property_id) == {4}
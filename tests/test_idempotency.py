@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+
+from database import get_db
+from models import Booking, IdempotencyKey
+from utils import idempotency
+
+
+GUEST_INFO = {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'}
+
+
+def _booking(property_id, day):
+    return {'property_id': property_id, 'check_in': day(2), 'check_out': day(4), 'guest_info': GUEST_INFO}
+
+
+def _bookings_of(property_id):
+    with get_db() as db:
+        return db.query(Booking).filter_by(property_id=property_id).count()
+
+
+def test_retry_replays_the_stored_response(client, make_property, guest, day):
+    property_id = make_property()
+    headers = {**guest, 'Idempotency-Key': 'retry-1'}
+
+    first = client.post('/bookings', headers=headers, json=_booking(property_id, day))
+    again = client.post('/bookings', headers=headers, json=_booking(property_id, day))
+
+    assert first.status_code == again.status_code == 201
+    assert again.get_json() == first.get_json()
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert _bookings_of(property_id) == 1
+
+
+def test_key_reused_with_another_body_is_rejected(client, make_property, guest, day):
+    property_id = make_property()
+    headers = {**guest, 'Idempotency-Key': 'retry-2'}
+    client.post('/bookings', headers=headers, json=_booking(property_id, day))
+
+    other = {**_booking(property_id, day), 'check_out': day(5)}
+    assert client.post('/bookings', headers=headers, json=other).status_code == 422
+
+
+def test_concurrent_duplicates_book_once(app, make_property, guest, day):
+    property_id = make_property()
+    headers = {**guest, 'Idempotency-Key': 'retry-3'}
+
+    def post(_):
+        return app.test_client().post('/bookings', headers=headers, json=_booking(property_id, day))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(post, range(16)))
+
+    assert {r.status_code for r in responses} == {201}
+    assert len({r.get_json()['booking_id'] for r in responses}) == 1
+    assert _bookings_of(property_id) == 1
+
+
+@pytest.mark.filterwarnings('error::sqlalchemy.exc.SAWarning')  # the re-INSERT may reuse the row's id
+def test_lease_of_a_dead_request_can_be_taken_over(client, make_property, guest, day):
+    property_id = make_property()
+    headers = {**guest, 'Idempotency-Key': 'retry-4'}
+    client.post('/bookings', headers=headers, json=_booking(property_id, day))
+
+    # As if the worker had died mid-request: in progress, lease over, no response stored
+    with get_db() as db:
+        row = db.query(IdempotencyKey).filter_by(key='retry-4').one()
+        row.status, row.response_body = 'in_progress', None
+        row.expires_at = idempotency._now() - timedelta(seconds=1)
+        db.commit()
+
+    r = client.post('/bookings', headers=headers, json=_booking(property_id, day))
+    assert 'Idempotent-Replayed' not in r.headers
+    assert r.status_code == 409  # ran again: the nights are already reserved
@@ -0,0 +1,157 @@
+"""
+Image uploads stored in R2, against the local S3 stand-in: one upload per variant of each
+distinct file, through the shared client.
+"""
+import io
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from config import Config
+from database import get_db
+from models import ImageJob
+from utils import image_jobs, images
+from utils.r2 import r2_client
+from utils.uploads import SPOOL_MEMORY_BYTES
+
+
+def _jpeg(size, color):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def _png(size, color):
+    buf = io.BytesIO()
+    Image.new('RGBA', size, color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _other_host(client):
+    email = f'host-{uuid.uuid4().hex[:8]}@example.com'
+    client.post('/register', json={'email': email, 'password': 'secret', 'role': 'host'})
+    token = client.post('/login', json={'email': email, 'password': 'secret'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def _puts(s3):
+    return [path for method, path in s3.requests if method == 'PUT']
+
+
+def test_process_images_uploads_the_variants_of_each_distinct_file(s3):
+    photo, logo = _jpeg((2400, 1600), 'navy'), _png((900, 900), (200, 30, 30, 128))
+    results, metrics = images.process_images([photo, photo, logo, b'not an image'])
+
+    assert results[0] == results[1]
+    assert isinstance(results[3], Exception)
+    assert metrics['files'] == 4 and metrics['failed'] == 1 and metrics['deduplicated'] == 1
+
+    stored = {key for meta in results[:3] for key in meta['keys']}
+    assert set(s3.objects) == stored and len(stored) == 2 * len(images.VARIANTS)
+    assert len(_puts(s3)) == len(stored)
+    for body, headers in s3.objects.values():
+        assert headers['Content-Type'] == 'image/webp'
+        assert 'immutable' in headers['Cache-Control']
+        assert Image.open(io.BytesIO(body)).format == 'WEBP'
+
+    meta = results[0]
+    assert (meta['width'], meta['height']) == (2400, 1600)
+    assert meta['url'] == f"https://cdn.example.com/images/{meta['digest']}/medium.webp"
+
+
+def test_uploads_share_one_client_and_its_connections(s3):
+    for color in ('red', 'green', 'blue'):
+        results, _ = images.process_images([_jpeg((1000, 800), color)])
+        assert not isinstance(results[0], Exception)
+
+    assert r2_client() is r2_client()
+    # Every batch reuses the pooled keep-alive connections instead of opening its own
+    assert len(s3.connections) < len(_puts(s3)) == 3 * len(images.VARIANTS)
+
+
+def test_upload_and_delete_through_the_api(client, host, make_property, s3):
+    property_id = make_property(nights=0)
+    r = client.post(f'/properties/{property_id}/images?wait=true', headers=host,
+                    data={'files': [(io.BytesIO(_jpeg((1200, 900), 'teal')), 'flat.jpg')]},
+                    content_type='multipart/form-data')
+    assert r.status_code == 200, r.get_json()
+    [uploaded] = r.get_json()['succeeded']
+    assert uploaded['url'].startswith('https://cdn.example.com/images/')
+    assert len(s3.objects) == len(images.VARIANTS)
+
+    r = client.delete(f"/properties/{property_id}/images/{uploaded['id']}", headers=host)
+    assert r.status_code == 200
+    assert s3.objects == {}
+
+
+def test_upload_accepts_the_files_array_key(client, host, make_property, s3):
+    property_id = make_property(nights=0)
+    r = client.post(f'/properties/{property_id}/images?wait=true', headers=host,
+                    data={'files[]': [(io.BytesIO(_jpeg((600, 400), 'olive')), 'flat.jpg')]},
+                    content_type='multipart/form-data')
+    assert r.status_code == 200, r.get_json()
+    assert len(r.get_json()['succeeded']) == 1
+
+
+def _spool_leftovers():
+    return os.listdir(Config.IMAGE_SPOOL_DIR) if os.path.isdir(Config.IMAGE_SPOOL_DIR) else []
+
+
+def test_spilled_upload_is_moved_into_the_spool_not_copied(client, host, make_property, s3, monkeypatch):
+    photo = io.BytesIO()
+    Image.effect_noise((1200, 900), 64).convert('RGB').save(photo, format='JPEG', quality=90)
+    photo = photo.getvalue()
+    assert len(photo) > SPOOL_MEMORY_BYTES
+    monkeypatch.setattr(FileStorage, 'save', lambda *args, **kwargs: pytest.fail('upload copied'))
+
+    property_id = make_property(nights=0)
+    r = client.post(f'/properties/{property_id}/images?wait=true', headers=host,
+                    data={'files': [(io.BytesIO(photo), 'big.jpg'), (io.BytesIO(_jpeg((64, 64), 'gray')), 'small.jpg')]},
+                    content_type='multipart/form-data')
+    assert r.status_code == 200, r.get_json()
+    assert len(r.get_json()['succeeded']) == 2
+    assert _spool_leftovers() == []
+
+
+def test_rejected_upload_leaves_no_temp_file(client, host, make_property, monkeypatch):
+    monkeypatch.setattr(Config, 'IMAGE_MAX_MB', 1)
+    property_id = make_property(nights=0)
+    photo = _jpeg((1000, 1000), 'black') + os.urandom(1024 * 1024)  # past the limit once spilled
+    r = client.post(f'/properties/{property_id}/images', headers=host,
+                    data={'files': [(io.BytesIO(photo), 'huge.jpg')]},
+                    content_type='multipart/form-data')
+    assert r.status_code == 413
+
+    # Spilled to disk, but the request was refused: not the owner
+    r = client.post(f'/properties/{property_id}/images', headers=_other_host(client),
+                    data={'files': [(io.BytesIO(photo[:600 * 1024]), 'big.jpg')]},
+                    content_type='multipart/form-data')
+    assert r.status_code == 403
+    assert _spool_leftovers() == []
+
+
+def test_lost_job_is_failed_and_its_spool_removed(client, host, make_property, monkeypatch):
+    property_id = make_property(nights=0)
+    # Queued, then its worker died: only the job row and the spooled file are left
+    monkeypatch.setattr(image_jobs, 'submit', lambda job_id: None)
+    r = client.post(f'/properties/{property_id}/images', headers=host,
+                    data={'files': [(io.BytesIO(_jpeg((64, 64), 'gray')), 'flat.jpg')]},
+                    content_type='multipart/form-data')
+    assert r.status_code == 202
+    status_url = r.get_json()['status_url']
+    assert client.get(status_url, headers=host).get_json()['status'] == 'queued'
+    assert _spool_leftovers() != []
+
+    with get_db() as db:
+        db.query(ImageJob).filter_by(id=r.get_json()['job_id']).update(
+            {ImageJob.heartbeat_at: datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)})
+        db.commit()
+
+    job = client.get(status_url, headers=host).get_json()
+    assert job['status'] == 'failed'
+    assert job['failed'] == [{'filename': 'flat.jpg', 'error': 'upload interrupted, please retry'}]
+    assert _spool_leftovers() == []
@@ -0,0 +1,38 @@
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from utils.pdf_generator import generate_voucher_pdf, render_voucher_batch, render_vouchers
+
+
+PROPERTY = SimpleNamespace(title='Sea view flat', location='Lisbon')
+GUEST_INFO = {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'}
+
+
+def _voucher(i):
+    check_in = date.today() + timedelta(days=i)
+    booking = SimpleNamespace(id=i, check_in=check_in, check_out=check_in + timedelta(days=2),
+                              total_price=Decimal('240.00'))
+    return booking, GUEST_INFO, PROPERTY
+
+
+def _pages(pdf):
+    return len(re.findall(rb'/Type /Page\b(?!s)', pdf))
+
+
+def test_single_voucher_is_a_one_page_pdf():
+    pdf = generate_voucher_pdf(*_voucher(1)).getvalue()
+    assert pdf.startswith(b'%PDF') and pdf.rstrip().endswith(b'%%EOF')
+    assert _pages(pdf) == 1
+
+
+def test_batch_shares_the_static_layer_across_pages():
+    vouchers = [_voucher(i) for i in range(20)]
+    batch = render_voucher_batch(vouchers).getvalue()
+    singles = [buffer.getvalue() for buffer in render_vouchers(vouchers)]
+
+    assert _pages(batch) == 20
+    assert all(_pages(pdf) == 1 for pdf in singles)
+    # Logo and header are stored once in the batch, not once per page
+    assert len(batch) < sum(len(pdf) for pdf in singles) / 5
@@ -0,0 +1,125 @@
+"""
+EXPLAIN QUERY PLAN checks of the hot availability/booking queries on SQLite: the statements
+a request actually runs are captured and explained with the same parameters.
+"""
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import database
+from config import Config
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(database.engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', capture)
+
+
+def plans(statements, table):
+    """ Plan lines (details) of the captured statements reading `table`. """
+    result = []
+    raw = database.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in statements:
+            if not re.search(rf'\bFROM {table}\b|\bJOIN {table}\b', statement):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            result.append([row[3] for row in cursor.fetchall()])
+    finally:
+        raw.close()
+    assert result, f'no query on {table} was captured'
+    return result
+
+
+def assert_no_table_scan(plan_lines, table):
+    scans = [line for line in plan_lines if re.match(rf'SCAN {table}\b', line)]
+    assert not scans, plan_lines
+
+
+@pytest.fixture
+def sql_search(monkeypatch):
+    """ Search evaluated in SQL (no availability index, no response cache). """
+    monkeypatch.setattr(Config, 'AVAILABILITY_INDEX', False)
+    monkeypatch.setattr(Config, 'SEARCH_CACHE_SIZE', 0)
+
+
+def test_search_counts_bookable_nights_with_the_partial_index(client, make_property, day, sql_search):
+    for _ in range(3):
+        make_property()
+    with captured_selects() as statements:
+        r = client.get(f'/search?check_in={day(2)}&check_out={day(5)}&include_partial=true')
+    assert r.status_code == 200
+
+    search_plans = [p for p in plans(statements, 'availability')
+                    if any('ix_availability_bookable' in line for line in p)]
+    assert search_plans, 'the search aggregate does not use ix_availability_bookable'
+    for plan in search_plans:
+        assert_no_table_scan(plan, 'availability')
+        assert not any(line.startswith('MATERIALIZE') for line in plan), plan
+
+
+def test_booking_check_reads_nights_by_property_and_date(client, make_property, guest, day, monkeypatch):
+    monkeypatch.setattr(Config, 'AVAILABILITY_INDEX', False)
+    property_id = make_property()
+    with captured_selects() as statements:
+        r = client.post('/bookings', headers=guest, json={
+            'property_id': property_id, 'check_in': day(2), 'check_out': day(4),
+            'guest_info': {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'},
+        })
+    assert r.status_code == 201
+
+    for plan in plans(statements, 'availability'):
+        assert_no_table_scan(plan, 'availability')
+        assert any('(property_id=? AND date' in line for line in plan), plan
+
+
+def test_bulk_update_reads_nights_by_property_and_date(client, make_property, host, day):
+    property_id = make_property()
+    with captured_selects() as statements:
+        r = client.put('/availability/bulk-update', headers=host, json={
+            'property_id': property_id, 'dates': {day(3): {'price': 120}, day(4): {'is_available': False}},
+        })
+    assert r.status_code == 200
+
+    for plan in plans(statements, 'availability'):
+        assert_no_table_scan(plan, 'availability')
+
+
+@pytest.mark.parametrize('path, index', [
+    ('/bookings', 'ix_bookings_user_created'),
+    # Sorted per request anyway (property_id IN ...): either property index will do
+    ('/host/bookings', 'ix_bookings_property_'),
+    ('/bookings?status=cancelled', 'ix_bookings_user_status_created'),
+    ('/host/bookings?status=cancelled', 'ix_bookings_property_status_created'),
+])
+def test_booking_listings_walk_the_composite_indexes(client, make_property, host, guest, day, path, index):
+    property_id = make_property()
+    client.post('/bookings', headers=guest, json={
+        'property_id': property_id, 'check_in': day(2), 'check_out': day(3),
+        'guest_info': {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'},
+    })
+    headers = guest if path.startswith('/bookings') else host
+    with captured_selects() as statements:
+        r = client.get(path, headers=headers)
+    assert r.status_code == 200
+
+    listing = plans(statements, 'bookings')
+    assert any(index in line for plan in listing for line in plan), listing
+    for plan in listing:
+        assert_no_table_scan(plan, 'bookings')
+        if headers is guest:
+            # Walked in (created_at, id) order, status filter included: no sort
+            assert not any('TEMP B-TREE' in line for line in plan), plan
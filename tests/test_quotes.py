@@ -0,0 +1,36 @@
+"""
+POST /quotes: per-stay validation, and the same notion of a bookable night as POST /bookings.
+"""
+from database import get_db
+from models import Availability
+
+
+GUEST_INFO = {'first_name': 'Ana', 'last_name': 'Silva', 'email': 'ana@example.com', 'phone': '1'}
+
+
+def test_property_id_must_be_an_integer(client, make_property, day):
+    property_id = make_property()
+    stays = [
+        {'property_id': [property_id], 'check_in': day(2), 'check_out': day(4)},
+        {'property_id': str(property_id), 'check_in': day(2), 'check_out': day(4)},
+        {'property_id': True, 'check_in': day(2), 'check_out': day(4)},
+    ]
+    r = client.post('/quotes', json={'stays': stays})
+    assert r.status_code == 200
+    listed, as_string, as_bool = r.get_json()
+    assert listed['error'] == as_bool['error'] == 'property_id must be an integer'
+    assert as_string['property_id'] == property_id and as_string['total_price'] == 200
+
+
+def test_quote_and_booking_agree_on_a_night_with_null_is_blocked(client, make_property, guest, day):
+    property_id = make_property()
+    with get_db() as db:
+        db.query(Availability).filter_by(property_id=property_id).update({Availability.is_blocked: None})
+        db.commit()
+
+    stay = {'property_id': property_id, 'check_in': day(2), 'check_out': day(4)}
+    [quote] = client.post('/quotes', json={'stays': [stay]}).get_json()
+    assert quote['available'] is True
+
+    r = client.post('/bookings', headers=guest, json={**stay, 'guest_info': GUEST_INFO})
+    assert r.status_code == 201, r.get_json()
@@ -0,0 +1,68 @@
+"""
+Search: rule-priced properties in SQL mode are evaluated from the cursor on, as far as the
+page goes; cached pages follow changes made by other workers.
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+import utils.search
+from config import Config
+from database import get_db
+from models import PropertyCard
+
+
+@pytest.fixture
+def evaluated(monkeypatch):
+    """ Ids of the properties whose nights the search read, per night_map call. """
+    calls = []
+    night_map = utils.search.night_map
+
+    def spy(db, property_ids, *args, **kwargs):
+        calls.append(list(property_ids))
+        return night_map(db, property_ids, *args, **kwargs)
+
+    monkeypatch.setattr(Config, 'AVAILABILITY_INDEX', False)
+    monkeypatch.setattr(Config, 'SEARCH_CACHE_SIZE', 0)
+    monkeypatch.setattr(utils.search, 'night_map', spy)
+    return calls
+
+
+def test_rule_priced_pages_evaluate_only_their_candidates(client, host, day, evaluated):
+    location = 'Ruled-' + day(0)
+    ids = []
+    for price in (90, 80, 70, 60, 50, 40):
+        r = client.post('/properties', headers=host, json={'title': f'Loft {price}', 'location': location})
+        assert r.status_code == 201, r.get_json()
+        ids.append(r.get_json()['property_id'])
+        client.post('/availability/rules', headers=host, json={
+            'property_id': ids[-1], 'start_date': day(1), 'end_date': day(9), 'price': price,
+        })
+
+    query = f'/search?check_in={day(2)}&check_out={day(4)}&location={location}&limit=2'
+    first = client.get(query)
+    assert [item['property_id'] for item in first.get_json()] == ids[:2]
+    assert evaluated == [ids[:2]]
+
+    evaluated.clear()
+    second = client.get(f"{query}&cursor={first.headers['X-Next-Cursor']}")
+    assert [item['property_id'] for item in second.get_json()] == ids[2:4]
+    assert evaluated == [ids[2:4]]
+    assert second.get_json()[0]['total_price'] == 140
+
+
+def test_cached_page_follows_a_cover_changed_by_another_worker(client, make_property, day, monkeypatch):
+    monkeypatch.setattr(Config, 'SEARCH_CACHE_SIZE', 16)
+    property_id = make_property(nights=5)
+    query = f'/search?check_in={day(2)}&check_out={day(4)}&location=Lisbon&cursor={property_id - 1}&limit=1'
+    assert client.get(query).get_json()[0]['cover_url'] is None
+    assert client.get(query).get_json()[0]['cover_url'] is None  # cached
+
+    # Written by another process: this one's cache entries were not dropped
+    with get_db() as db:
+        db.query(PropertyCard).filter_by(property_id=property_id).update({
+            PropertyCard.cover_url: 'https://cdn.example.com/cover.webp',
+            PropertyCard.updated_at: datetime.now(timezone.utc),
+        })
+        db.commit()
+    assert client.get(query).get_json()[0]['cover_url'] == 'https://cdn.example.com/cover.webp'
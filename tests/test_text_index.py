@@ -0,0 +1,29 @@
+"""
+Trigram index of property titles/locations: inserts of other workers are picked up, also
+when their ids commit out of order.
+"""
+from database import get_db
+from models import Property
+from utils import text_index
+
+
+def _insert(property_id, host_id, location):
+    """ As another worker would: committed straight to the DB, not added to this process's index. """
+    with get_db() as db:
+        db.add(Property(id=property_id, title=f'Flat {property_id}', location=location, host_id=host_id))
+        db.commit()
+
+
+def test_ids_committed_out_of_order_are_found(make_property):
+    first = make_property(nights=0)
+    with get_db() as db:
+        host_id = db.get(Property, first).host_id
+
+    location = f'Outoforder {first}'
+    _insert(first + 2, host_id, location)  # the bigger id commits first
+    with get_db() as db:
+        assert text_index.match(db, location=location) == {first + 2}
+
+    _insert(first + 1, host_id, location)
+    with get_db() as db:
+        assert text_index.match(db, location=location) == {first + 1, first + 2}
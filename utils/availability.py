@@ -1,28 +1,127 @@
+import threading
+from contextlib import contextmanager
 from datetime import timedelta
 
-from models import Availability
+from sqlalchemy import update
 
+from models import Availability, Property
+from utils import availability_index, search_cache
+from utils.pricing_rules import rules_for, expand_rules
+from utils.search import BOOKABLE, is_bookable
 
-def check_property_availability(db, property_id, check_in, check_out):
+
+# SQLite has no row locks: bookings of one property serialize on one of these stripes
+# (per process; the conditional UPDATE in reserve_nights still guards across processes).
+LOCK_STRIPES = 64
+_stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def bump_calendar_version(prop):
+    """ Marks the property's calendar as changed; the increment is done by the DB on flush. """
+    prop.calendar_version = Property.calendar_version + 1
+
+
+def calendar_changed(prop, nights):
+    """
+    Call after committing availability changes of `prop` (with bump_calendar_version).
+    nights: [(date, price, is_available, is_reserved, is_blocked)] as written, or None when
+    the change can't be expressed per night (pricing rules).
+    """
+    availability_index.apply(prop.id, prop.calendar_version, nights)
+    search_cache.invalidate_property(prop.id)
+
+
+@contextmanager
+def property_lock(db, property_id):
+    """
+    Serializes the check-and-reserve of one property on SQLite (other properties use other
+    stripes). A no-op on other databases, where check_property_availability(for_update=True)
+    locks the rows themselves.
+    """
+    if db.get_bind().dialect.name != 'sqlite':
+        yield
+        return
+    with _stripes[property_id % LOCK_STRIPES]:
+        yield
+
+
+def check_property_availability(db, property_id, check_in, check_out, for_update=False):
     """
     Checks if a property has available and unreserved dates for the given range.
+    Nights without an availability row fall back to the property's pricing rules; those
+    are returned as new, not yet added Availability objects.
+    for_update=True reads the rows with SELECT ... FOR UPDATE (ignored by SQLite), so they
+    stay locked until the caller's transaction ends.
     Returns a tuple: (success: bool, availabilities: list, message: str)
     """
     total_nights = (check_out - check_in).days
     if total_nights <= 0:
         return False, [], 'Check-out must be after check-in'
 
+    # Fast reject from the in-memory calendar; the rows are still read for the reservation.
+    if availability_index.enabled():
+        version = db.query(Property.calendar_version).filter(Property.id == property_id).scalar()
+        if version is not None:
+            cal = availability_index.load(db, {property_id: version})[property_id]
+            if not cal.is_bookable(check_in, check_out):
+                return False, [], 'Some dates are not available for booking'
+
     date_range = [check_in + timedelta(days=i) for i in range(total_nights)]
 
-    availabilities = db.query(Availability).filter(
+    q = db.query(Availability).filter(
         Availability.property_id == property_id,
-        Availability.date.in_(date_range),
-        Availability.is_available == True,
-        Availability.is_reserved == False,
-        Availability.is_blocked == False
-    ).all()
+        Availability.date.in_(date_range)
+    )
+    if for_update:
+        q = q.with_for_update()
+    rows = q.all()
+    by_date = {a.date: a for a in rows}
+
+    # Nights without a row are priced by the pricing rules (if any)
+    rule_nights = {}
+    if len(by_date) != total_nights:
+        rules = rules_for(db, [property_id], check_in, check_out)[property_id]
+        rule_nights = expand_rules(rules, check_in, check_out)
 
-    if len(availabilities) != total_nights:
-        return False, [], 'Some dates are not available for booking'
+    availabilities = []
+    for day in date_range:
+        a = by_date.get(day)
+        if a is not None:
+            if not is_bookable(a):
+                return False, [], 'Some dates are not available for booking'
+        else:
+            price, is_available = rule_nights.get(day, (None, False))
+            if not is_available:
+                return False, [], 'Some dates are not available for booking'
+            # New (transient) row; the caller adds it to the session when reserving.
+            a = Availability(property_id=property_id, date=day, price=price,
+                             is_available=True, is_reserved=False, is_blocked=False)
+        availabilities.append(a)
+
+    return True, availabilities, 'Dates are available'
+
+
+def reserve_nights(db, availabilities):
+    """
+    Reserves the nights returned by check_property_availability, in the caller's transaction.
+    Existing rows are flipped by one UPDATE that only matches still bookable rows; if one was
+    taken in the meantime nothing is reserved and False is returned (the caller rolls back).
+    Rule-priced nights are added as new rows; a concurrent booking of the same night makes
+    the commit fail with IntegrityError (unique property_id + date).
+    """
+    existing = [a.id for a in availabilities if a.id is not None]
+    if existing:
+        result = db.execute(
+            update(Availability.__table__)
+            .where(Availability.id.in_(existing), BOOKABLE)
+            .values(is_reserved=True)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(existing):
+            return False
 
-    return True, availabilities, 'Dates are available'
\ No newline at end of file
+    for a in availabilities:
+        if a.id is None:
+            a.is_reserved = True
+            db.add(a)
+    return True
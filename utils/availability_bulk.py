@@ -0,0 +1,281 @@
+from datetime import date, datetime
+from itertools import islice
+
+from sqlalchemy import bindparam, delete, insert, update
+
+from models import Availability
+
+
+# Rows per INSERT/UPDATE statement
+BATCH_SIZE = 500
+
+# Availability.blocked_by of the blocks written by calendar imports
+IMPORT = 'import'
+
+_availability = Availability.__table__
+
+
+def _batches(items):
+    for i in range(0, len(items), BATCH_SIZE):
+        yield items[i:i + BATCH_SIZE]
+
+
+def _insert_new_dates(db, rows):
+    """
+    Inserts rows, skipping dates that already exist (unique property_id + date), and returns
+    the inserted dates. Uses INSERT ... ON CONFLICT DO NOTHING RETURNING where supported,
+    so concurrent requests can't create duplicates; other dialects read first.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        inserted = set()
+        for batch in _batches(rows):
+            stmt = (
+                dialect_insert(_availability)
+                .values(batch)
+                .on_conflict_do_nothing(index_elements=['property_id', 'date'])
+                .returning(_availability.c.date)
+            )
+            inserted.update(d for (d,) in db.execute(stmt))
+        return inserted
+
+    existing = set()
+    if rows:
+        existing = {
+            d for (d,) in db.query(Availability.date).filter(
+                Availability.property_id == rows[0]['property_id'],
+                Availability.date.in_([r['date'] for r in rows])
+            )
+        }
+    new_rows = [r for r in rows if r['date'] not in existing]
+    for batch in _batches(new_rows):
+        db.execute(insert(_availability), batch)
+    return {r['date'] for r in new_rows}
+
+
+def bulk_create(db, property_id, valid_items):
+    """
+    Creates availability rows for parse_valid_dates() items with multi-row
+    INSERT ... ON CONFLICT DO NOTHING statements. Existing dates are reported and left untouched.
+    Returns (results, written) where written is [(date, price, is_available, is_reserved, is_blocked)].
+    The caller commits.
+    """
+    rows = [
+        {
+            'property_id': property_id,
+            'date': item['parsed_date'],
+            'price': item['price'],
+            'is_available': item['is_available'],
+            'is_reserved': False,
+            'is_blocked': item.get('is_blocked', False),
+        }
+        for item in valid_items
+    ]
+    inserted = _insert_new_dates(db, rows)
+
+    results = []
+    for item in valid_items:
+        if item['parsed_date'] not in inserted:
+            results.append({
+                'error': 'Availability already exists',
+                'date': item['date_str']
+            })
+            continue
+        results.append({
+            'msg': 'Availability created',
+            'date': item['date_str'],
+            'is_available': item['is_available']
+        })
+
+    written = [(r['date'], r['price'], r['is_available'], False, r['is_blocked'])
+               for r in rows if r['date'] in inserted]
+    return results, written
+
+
+def _validate_update(date_str, item, today):
+    """ Returns (parsed date, changes) or (None, error message). """
+    try:
+        item_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return None, 'Invalid date format'
+    # Past dates not allowed
+    if item_date < today:
+        return None, 'Cannot update past dates'
+
+    changes = {}
+    if 'price' in item:
+        try:
+            changes['price'] = float(item['price'])
+        except (TypeError, ValueError):
+            return None, 'Invalid price format'
+    if 'is_available' in item:
+        if not isinstance(item['is_available'], bool):
+            return None, 'is_available must be boolean'
+        changes['is_available'] = item['is_available']
+    if 'is_blocked' in item:
+        if not isinstance(item['is_blocked'], bool):
+            return None, 'is_blocked must be boolean'
+        changes['is_blocked'] = item['is_blocked']
+    return item_date, changes
+
+
+def bulk_update(db, property_id, dates_dict):
+    """
+    Updates existing availability rows from {date_str: {price?, is_available?, is_blocked?}}:
+    per-item validation in memory, one read of the affected rows, then batched
+    executemany UPDATEs. Reserved rows are never modified (also re-checked in the
+    UPDATE itself, in case a booking lands in between). Setting is_blocked makes the block
+    (or its removal) the host's own: later calendar imports leave it alone.
+    Returns (results, written) like bulk_create. The caller commits.
+    """
+    today = date.today()
+    results = {}
+    valid = {}
+    for date_str, item in dates_dict.items():
+        item_date, changes = _validate_update(date_str, item or {}, today)
+        if item_date is None:
+            results[date_str] = {'error': changes, 'date': date_str}
+        else:
+            valid[date_str] = (item_date, changes)
+
+    rows = {}
+    if valid:
+        rows = {
+            a.date: a for a in db.query(
+                Availability.id,
+                Availability.date,
+                Availability.price,
+                Availability.is_available,
+                Availability.is_reserved,
+                Availability.is_blocked,
+                Availability.blocked_by,
+            ).filter(
+                Availability.property_id == property_id,
+                Availability.date.in_([d for d, _ in valid.values()])
+            )
+        }
+
+    params = []
+    written = {}
+    for date_str, (item_date, changes) in valid.items():
+        row = rows.get(item_date)
+        if row is None:
+            results[date_str] = {'error': 'Availability not found', 'date': date_str}
+            continue
+        if row.is_reserved:
+            results[date_str] = {'error': 'Cannot update reserved date', 'date': date_str}
+            continue
+
+        price = changes.get('price', row.price)
+        is_available = changes.get('is_available', row.is_available)
+        is_blocked = changes.get('is_blocked', bool(row.is_blocked))
+        blocked_by = None if 'is_blocked' in changes else row.blocked_by
+        params.append({'b_id': row.id, 'b_price': price, 'b_is_available': is_available,
+                       'b_is_blocked': is_blocked, 'b_blocked_by': blocked_by})
+        written[date_str] = (item_date, price, is_available, False, is_blocked)
+        results[date_str] = {'msg': 'Availability updated', 'date': date_str}
+
+    stmt = (
+        update(_availability)
+        .where(_availability.c.id == bindparam('b_id'), _availability.c.is_reserved == False)
+        .values(price=bindparam('b_price'), is_available=bindparam('b_is_available'),
+                is_blocked=bindparam('b_is_blocked'), blocked_by=bindparam('b_blocked_by'))
+    )
+    rowcounts = [db.execute(stmt, batch).rowcount for batch in _batches(params)]
+
+    # rowcount is -1 where the driver doesn't report it for executemany
+    if params and min(rowcounts) >= 0 and sum(rowcounts) != len(params):
+        # Some rows were reserved after the read: report them as such.
+        reserved = {
+            d for (d,) in db.query(Availability.date).filter(
+                Availability.id.in_([p['b_id'] for p in params]),
+                Availability.is_reserved == True
+            )
+        }
+        for date_str, (item_date, _) in valid.items():
+            if item_date in reserved:
+                results[date_str] = {'error': 'Cannot update reserved date', 'date': date_str}
+                written.pop(date_str, None)
+
+    # Keep the request's order in the report
+    return [results[date_str] for date_str in dates_dict], list(written.values())
+
+
+def bulk_block(db, property_id, nights):
+    """
+    Marks the given nights (any iterable of dates, consumed BATCH_SIZE at a time) as blocked
+    by an import: one UPDATE of the existing rows (reserved or already blocked ones are left
+    alone, so the host's blocks stay theirs) and one INSERT ... ON CONFLICT DO NOTHING of the
+    missing ones per batch.
+    Returns (rows changed, set of the nights given). The caller commits.
+    """
+    nights = iter(nights)
+    changed, seen = 0, set()
+    while True:
+        batch = sorted(set(islice(nights, BATCH_SIZE)) - seen)
+        if not batch:
+            return changed, seen
+        seen.update(batch)
+        changed += db.execute(
+            update(_availability)
+            .where(
+                _availability.c.property_id == property_id,
+                _availability.c.date.in_(batch),
+                _availability.c.is_reserved == False,
+                _availability.c.is_blocked.isnot(True),
+            )
+            .values(is_blocked=True, blocked_by=IMPORT)
+        ).rowcount
+        changed += len(_insert_new_dates(db, [
+            {
+                'property_id': property_id,
+                'date': day,
+                'price': 0,
+                'is_available': False,
+                'is_reserved': False,
+                'is_blocked': True,
+                'blocked_by': IMPORT,
+            }
+            for day in batch
+        ]))
+
+
+def bulk_unblock(db, property_id, start, end, keep):
+    """
+    Clears the import blocks (bulk_block) of [start, end) except on the nights in `keep`;
+    the host's own blocks and reserved nights are not touched. Rows that only exist as a
+    block (no price, not available, as bulk_block inserts them) are deleted so pricing rules
+    apply to the night again; other rows keep their price and availability.
+    Returns the number of nights unblocked. The caller commits.
+    """
+    blocked = db.query(Availability.id, Availability.date, Availability.price, Availability.is_available).filter(
+        Availability.property_id == property_id,
+        Availability.date >= start,
+        Availability.date < end,
+        Availability.is_reserved == False,
+        Availability.is_blocked == True,
+        Availability.blocked_by == IMPORT,
+    ).all()
+    stale = [row for row in blocked if row.date not in keep]
+    placeholders = [row.id for row in stale if not row.price and not row.is_available]
+    priced = [row.id for row in stale if row.price or row.is_available]
+
+    count = 0
+    for batch in _batches(placeholders):
+        count += db.execute(
+            delete(_availability)
+            .where(_availability.c.id.in_(batch), _availability.c.is_reserved == False,
+                   _availability.c.blocked_by == IMPORT)
+        ).rowcount
+    for batch in _batches(priced):
+        count += db.execute(
+            update(_availability)
+            .where(_availability.c.id.in_(batch), _availability.c.is_reserved == False,
+                   _availability.c.blocked_by == IMPORT)
+            .values(is_blocked=False, blocked_by=None)
+        ).rowcount
+    return count
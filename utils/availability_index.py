@@ -0,0 +1,212 @@
+"""
+Process-local availability index.
+
+Per property it keeps a day-offset calendar: two bitsets (night has a record / night is
+bookable) and two packed price arrays (record price / price of bookable nights, 0 otherwise).
+A date-range check is then a shift-and-mask and a range total is a slice sum.
+
+Each calendar is tagged with `Property.calendar_version`. Writers bump the version in the
+same transaction as their availability changes and call `apply()` after commit; readers pass
+the versions they just read from the DB to `load()`, which reloads stale or missing calendars
+in one query. That keeps the index correct across worker processes.
+"""
+import threading
+from array import array
+from datetime import timedelta
+
+from config import Config
+from models import Availability, Property
+from utils.pricing_rules import rules_for, expand_rules
+
+
+_ONE_DAY = timedelta(days=1)
+
+
+class Calendar:
+    """ Nights of one property, offset i = start + i days. Treated as immutable once published. """
+    __slots__ = ('version', 'start', 'present', 'bookable', 'prices', 'sellable')
+
+    def __init__(self, version, start=None, days=0):
+        self.version = version
+        self.start = start
+        self.present = 0
+        self.bookable = 0
+        self.prices = array('d', bytes(8 * days))
+        self.sellable = array('d', bytes(8 * days))
+
+    def copy(self, version):
+        cal = Calendar(version, self.start)
+        cal.present = self.present
+        cal.bookable = self.bookable
+        cal.prices = array('d', self.prices)
+        cal.sellable = array('d', self.sellable)
+        return cal
+
+    def _offset(self, day):
+        """ Offset of `day`, growing the calendar when it falls outside the current span. """
+        if self.start is None:
+            self.start = day
+        offset = (day - self.start).days
+        if offset < 0:
+            pad = array('d', bytes(8 * -offset))
+            self.prices = pad + self.prices
+            self.sellable = pad + self.sellable
+            self.present <<= -offset
+            self.bookable <<= -offset
+            self.start = day
+            offset = 0
+        elif offset >= len(self.prices):
+            pad = array('d', bytes(8 * (offset + 1 - len(self.prices))))
+            self.prices.extend(pad)
+            self.sellable.extend(pad)
+        return offset
+
+    def set_night(self, day, price, is_available, is_reserved, is_blocked):
+        i = self._offset(day)
+        bit = 1 << i
+        is_bookable = bool(is_available and not is_reserved and not is_blocked)
+        self.present |= bit
+        self.prices[i] = price
+        if is_bookable:
+            self.bookable |= bit
+            self.sellable[i] = price
+        else:
+            self.bookable &= ~bit
+            self.sellable[i] = 0.0
+
+    def _window(self, check_in, check_out):
+        """ Clipped offsets [a, b) of the range inside the calendar span. """
+        if self.start is None:
+            return 0, 0
+        a = max((check_in - self.start).days, 0)
+        b = min((check_out - self.start).days, len(self.prices))
+        return a, max(a, b)
+
+    def summary(self, check_in, check_out):
+        """ (bookable_nights, total_price of bookable nights) for [check_in, check_out). """
+        a, b = self._window(check_in, check_out)
+        if a == b:
+            return 0, 0.0
+        mask = (self.bookable >> a) & ((1 << (b - a)) - 1)
+        return mask.bit_count(), sum(self.sellable[a:b])
+
+    def is_bookable(self, check_in, check_out):
+        return self.summary(check_in, check_out)[0] == (check_out - check_in).days
+
+    def window(self, start, end):
+        """ (sellable prices, bookable flags) per night of [start, end), 0 outside the calendar. """
+        days = (end - start).days
+        prices = [0.0] * days
+        bookable = [0] * days
+        a, b = self._window(start, end)
+        if a < b:
+            lead = (self.start - start).days if self.start > start else 0
+            prices[lead:lead + b - a] = self.sellable[a:b]
+            bits = self.bookable >> a
+            for i in range(b - a):
+                bookable[lead + i] = (bits >> i) & 1
+        return prices, bookable
+
+    def nights(self, check_in, check_out):
+        """ {date: (price, is_available)} for the nights of the range that have a record. """
+        result = {}
+        if self.start is None:
+            return result
+        day = check_in
+        for i in range((check_in - self.start).days, (check_out - self.start).days):
+            if 0 <= i < len(self.prices) and (self.present >> i) & 1:
+                result[day] = (self.prices[i], bool((self.bookable >> i) & 1))
+            day += _ONE_DAY
+        return result
+
+
+_calendars = {}
+_lock = threading.Lock()
+
+
+def enabled():
+    return Config.AVAILABILITY_INDEX
+
+
+def _build(db, versions, restrict=True):
+    """
+    Builds calendars for {property_id: version}: pricing rules are expanded first, then the
+    availability rows (which override them) are streamed in one query.
+    """
+    calendars = {pid: Calendar(version) for pid, version in versions.items()}
+    for pid, rules in rules_for(db, list(versions) if restrict else None).items():
+        cal = calendars.get(pid)
+        if cal is None or not rules:
+            continue
+        for day, (price, is_available) in sorted(expand_rules(rules).items()):
+            cal.set_night(day, price, is_available, False, False)
+
+    q = (
+        db.query(
+            Availability.property_id,
+            Availability.date,
+            Availability.price,
+            Availability.is_available,
+            Availability.is_reserved,
+            Availability.is_blocked,
+        )
+        .order_by(Availability.property_id, Availability.date)
+    )
+    if restrict:
+        q = q.filter(Availability.property_id.in_(list(versions)))
+    for pid, day, price, is_available, is_reserved, is_blocked in q.yield_per(5000):
+        cal = calendars.get(pid)
+        if cal is not None:
+            cal.set_night(day, float(price), is_available, is_reserved, is_blocked)
+    return calendars
+
+
+def rebuild(db):
+    """ Rebuilds the whole index from the DB (startup). """
+    versions = dict(db.query(Property.id, Property.calendar_version).all())
+    calendars = _build(db, versions, restrict=False)
+    with _lock:
+        _calendars.clear()
+        _calendars.update(calendars)
+
+
+def load(db, versions):
+    """
+    Returns {property_id: Calendar} for {property_id: calendar_version} read from the DB.
+    Stale or missing calendars are reloaded together in one query.
+    """
+    found = {}
+    stale = {}
+    for pid, version in versions.items():
+        cal = _calendars.get(pid)
+        if cal is not None and cal.version == version:
+            found[pid] = cal
+        else:
+            stale[pid] = version
+    if stale:
+        fresh = _build(db, stale)
+        with _lock:
+            for pid, cal in fresh.items():
+                current = _calendars.get(pid)
+                if current is None or current.version <= cal.version:
+                    _calendars[pid] = cal
+        found.update(fresh)
+    return found
+
+
+def apply(property_id, version, nights):
+    """
+    Applies committed night changes [(date, price, is_available, is_reserved, is_blocked)]
+    that produced `version`. If the cached calendar is not exactly one version behind,
+    some other change was missed and the calendar is dropped to be reloaded on next use.
+    nights=None (e.g. pricing rule changes) always drops it.
+    """
+    with _lock:
+        cal = _calendars.get(property_id)
+        if cal is None or nights is None or cal.version + 1 != version:
+            _calendars.pop(property_id, None)
+            return
+        cal = cal.copy(version)
+        for day, price, is_available, is_reserved, is_blocked in nights:
+            cal.set_night(day, float(price), is_available, is_reserved, is_blocked)
+        _calendars[property_id] = cal
@@ -0,0 +1,108 @@
+"""
+Minimal iCalendar (RFC 5545) reading and writing for calendar sync with other channels.
+
+Only what availability sync needs: all-day VEVENTs marking busy nights. Both directions
+work on iterators, so a multi-year feed is never held in memory as a whole.
+"""
+from datetime import datetime, timedelta, timezone
+
+
+_ONE_DAY = timedelta(days=1)
+
+PRODID = '-//Dream Stay//Availability//EN'
+
+
+def unfold(lines):
+    """ Yields logical content lines from raw (bytes or str) lines, joining folded ones. """
+    current = None
+    for raw in lines:
+        line = raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _parse_date(value):
+    """ DATE (YYYYMMDD) or DATE-TIME value, reduced to its date. """
+    return datetime.strptime(value.strip()[:8], '%Y%m%d').date()
+
+
+def iter_events(lines):
+    """
+    Yields (start, end) date pairs (end not included) of the VEVENTs in `lines`.
+    Events without DTEND last one night; events that can't be parsed are skipped.
+    """
+    event = None
+    for line in unfold(lines):
+        name, _, value = line.partition(':')
+        name = name.split(';', 1)[0].upper()
+        if name == 'BEGIN' and value.strip().upper() == 'VEVENT':
+            event = {}
+        elif name == 'END' and value.strip().upper() == 'VEVENT':
+            if event and 'start' in event:
+                end = event.get('end') or event['start'] + _ONE_DAY
+                if end > event['start']:
+                    yield event['start'], end
+            event = None
+        elif event is not None and name in ('DTSTART', 'DTEND'):
+            try:
+                event['start' if name == 'DTSTART' else 'end'] = _parse_date(value)
+            except ValueError:
+                event = None
+
+
+def iter_nights(events, start=None, end=None):
+    """ Expands (start, end) events into single nights, clipped to [start, end). """
+    for event_start, event_end in events:
+        day = event_start if start is None else max(event_start, start)
+        last = event_end if end is None else min(event_end, end)
+        while day < last:
+            yield day
+            day += _ONE_DAY
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def generate(property_id, events):
+    """
+    Yields an iCalendar document, a few lines at a time, for (start, end, summary) events
+    (all-day, end not included).
+    """
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield f'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\n'
+    for start, end, summary in events:
+        yield (
+            'BEGIN:VEVENT\r\n'
+            f'UID:{property_id}-{start:%Y%m%d}@dream-stay\r\n'
+            f'DTSTAMP:{stamp}\r\n'
+            f'DTSTART;VALUE=DATE:{start:%Y%m%d}\r\n'
+            f'DTEND;VALUE=DATE:{end:%Y%m%d}\r\n'
+            f'SUMMARY:{_escape(summary)}\r\n'
+            'TRANSP:OPAQUE\r\n'
+            'END:VEVENT\r\n'
+        )
+    yield 'END:VCALENDAR\r\n'
+
+
+def group_nights(nights):
+    """ Merges (date, summary) nights in date order into (start, end, summary) events. """
+    start = last = summary = None
+    for day, day_summary in nights:
+        if start is not None and day == last + _ONE_DAY and day_summary == summary:
+            last = day
+            continue
+        if start is not None:
+            yield start, last + _ONE_DAY, summary
+        start = last = day
+        summary = day_summary
+    if start is not None:
+        yield start, last + _ONE_DAY, summary
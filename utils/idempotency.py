@@ -0,0 +1,171 @@
+"""
+Idempotency-Key support for POST endpoints, stored in the `idempotency_keys` table so every
+worker process sees the same keys.
+
+The first request with a key claims it (INSERT under a unique (endpoint, user, key)
+constraint), runs the view and stores its response; a retry with the same key (same user,
+same endpoint), on any worker, gets that response replayed without touching the data. A
+duplicate arriving while the first one is still running waits for it instead of running in
+parallel. Reusing a key with a different body is rejected with 422.
+
+A claim is a lease of IN_FLIGHT_SECONDS: if its worker dies, the key can be claimed again
+once the lease is over. Stored responses expire after IDEMPOTENCY_TTL; expired rows are
+purged now and then by the requests themselves.
+"""
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from database import get_db
+from models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# How long a duplicate waits for the in-flight request (seconds)
+WAIT_SECONDS = 30
+# Lease of an in-flight claim; longer than any request is expected to run (seconds)
+IN_FLIGHT_SECONDS = 120
+# Share of claims that also purge the expired rows
+PURGE_RATE = 0.01
+
+
+def enabled():
+    return Config.IDEMPOTENCY_ENABLED
+
+
+def _now():
+    # Naive UTC, like the DateTime columns store it
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _claim(scope, fingerprint):
+    """
+    Returns (row id, None) if this request runs the view, else (None, the existing row).
+    An expired row (stored response past its TTL, or lease of a dead request) is replaced.
+    """
+    endpoint, user_id, key = scope
+    with get_db() as db:
+        if random.random() < PURGE_RATE:
+            db.query(IdempotencyKey).filter(IdempotencyKey.expires_at < _now()).delete(synchronize_session=False)
+            db.commit()
+
+        for _ in range(2):
+            row = IdempotencyKey(
+                endpoint=endpoint, user_id=user_id, key=key, fingerprint=fingerprint,
+                status='in_progress', expires_at=_now() + timedelta(seconds=IN_FLIGHT_SECONDS),
+            )
+            db.add(row)
+            try:
+                db.commit()
+                return row.id, None
+            except IntegrityError:
+                db.rollback()
+
+            existing = db.query(IdempotencyKey).filter_by(endpoint=endpoint, user_id=user_id, key=key).first()
+            if existing is None:
+                continue  # released meanwhile
+            if existing.expires_at >= _now():
+                db.expunge(existing)
+                return None, existing
+            # Out of the session first: the re-INSERT may get the same id.
+            # Conditional, so only one of several concurrent retries replaces it
+            db.expunge(existing)
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == existing.id, IdempotencyKey.expires_at < _now()
+            ).delete(synchronize_session=False)
+            db.commit()
+        return None, None
+
+
+def _wait(row_id):
+    """ Polls the in-flight row until its response is stored; None if it is gone or still running. """
+    deadline = time.monotonic() + WAIT_SECONDS
+    delay = 0.05
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        with get_db() as db:
+            row = db.get(IdempotencyKey, row_id)
+            if row is None:
+                return None
+            if row.status == 'done':
+                db.expunge(row)
+                return row
+    return None
+
+
+def _store(row_id, response):
+    headers = [[name, value] for name, value in response.headers
+               if name not in ('Content-Type', 'Content-Length')]
+    with get_db() as db:
+        db.query(IdempotencyKey).filter(IdempotencyKey.id == row_id).update({
+            IdempotencyKey.status: 'done',
+            IdempotencyKey.response_status: response.status_code,
+            IdempotencyKey.response_mimetype: response.mimetype,
+            IdempotencyKey.response_headers: headers,
+            IdempotencyKey.response_body: response.get_data(),
+            IdempotencyKey.expires_at: _now() + timedelta(seconds=Config.IDEMPOTENCY_TTL),
+        }, synchronize_session=False)
+        db.commit()
+
+
+def _release(row_id):
+    """ Forgets an attempt whose response is not replayable (server error, streamed body). """
+    with get_db() as db:
+        db.query(IdempotencyKey).filter(IdempotencyKey.id == row_id).delete(synchronize_session=False)
+        db.commit()
+
+
+def _replay(row):
+    response = Response(row.response_body, status=row.response_status, mimetype=row.response_mimetype)
+    response.headers.extend([tuple(header) for header in row.response_headers or []])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """ Decorator (under @jwt_required) honouring the Idempotency-Key header. """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not enabled():
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} cannot be longer than {MAX_KEY_LENGTH} characters'}), 400
+
+        scope = (request.endpoint, str(get_jwt_identity()), key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        row_id, existing = _claim(scope, fingerprint)
+
+        if row_id is None:
+            if existing is None:
+                return jsonify({'error': f'A request with this {HEADER} is still in progress'}), 409
+            if existing.fingerprint != fingerprint:
+                return jsonify({'error': f'{HEADER} was already used with a different request'}), 422
+            if existing.status != 'done':
+                existing = _wait(existing.id)
+                if existing is None:
+                    return jsonify({'error': f'A request with this {HEADER} is still in progress'}), 409
+            return _replay(existing)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _release(row_id)
+            raise
+
+        if response.status_code >= 500 or response.is_streamed or response.direct_passthrough:
+            _release(row_id)
+            return response
+
+        _store(row_id, response)
+        return response
+    return wrapper
@@ -0,0 +1,97 @@
+"""
+Reference counts of the content-addressed image variants (ImageBlob, see utils/images.py).
+
+Every PropertyImage row holds one reference to the blob of its digest. `claim` takes the
+reference of an upload found to be stored already (before its image is inserted, so the
+blob can't be deleted meanwhile), `acquire` adds the references of the newly inserted
+images, `release` drops one and returns the storage keys to remove once nothing uses the
+blob anymore. Keys are deleted from storage only after the transaction commits
+(`delete_objects`).
+"""
+from collections import Counter
+
+from models import ImageBlob
+from utils.storage import storage
+
+
+_blobs = ImageBlob.__table__
+
+
+def claim(db, digests):
+    """
+    Takes one reference on each of the given blobs that is stored, with a conditional
+    UPDATE (a blob whose count already dropped to 0 is being deleted and counts as not
+    stored), and commits. Returns {digest: meta} of the claimed blobs, for
+    utils.images.process_images(known=...). Each claim is later turned into an image
+    reference by acquire(claimed=...) or given back with release().
+    """
+    claimed = [
+        digest for digest in digests
+        if db.query(ImageBlob).filter(ImageBlob.digest == digest, ImageBlob.ref_count > 0).update(
+            {ImageBlob.ref_count: ImageBlob.ref_count + 1}, synchronize_session=False)
+    ]
+    db.commit()
+    if not claimed:
+        return {}
+    return dict(db.query(ImageBlob.digest, ImageBlob.meta).filter(ImageBlob.digest.in_(claimed)))
+
+
+def acquire(db, metas, claimed=()):
+    """
+    Adds a reference per processed image (metadata dicts of process_images), less the one
+    already taken by claim() for each digest in `claimed`.
+    """
+    counts = Counter(meta['digest'] for meta in metas)
+    counts.subtract(set(claimed) & set(counts))
+    counts = +counts
+    if not counts:
+        return
+    by_digest = {meta['digest']: meta for meta in metas}
+    rows = [{'digest': d, 'meta': by_digest[d], 'ref_count': n} for d, n in counts.items()]
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(_blobs).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=['digest'],
+            set_={'ref_count': _blobs.c.ref_count + stmt.excluded.ref_count},
+        ))
+        return
+
+    existing = {d for (d,) in db.query(ImageBlob.digest).filter(ImageBlob.digest.in_(counts))}
+    for row in rows:
+        if row['digest'] in existing:
+            db.query(ImageBlob).filter(ImageBlob.digest == row['digest']).update(
+                {ImageBlob.ref_count: ImageBlob.ref_count + row['ref_count']}, synchronize_session=False)
+        else:
+            db.add(ImageBlob(**row))
+    db.flush()
+
+
+def release(db, digest):
+    """
+    Drops one reference. Returns the storage keys of the blob if that was the last one (the
+    row is deleted; remove the keys after committing), else an empty list.
+    """
+    db.query(ImageBlob).filter(ImageBlob.digest == digest).update(
+        {ImageBlob.ref_count: ImageBlob.ref_count - 1}, synchronize_session=False)
+    meta = db.query(ImageBlob.meta).filter(ImageBlob.digest == digest, ImageBlob.ref_count <= 0).scalar()
+    if meta is None:
+        return []
+    # Conditional, so a reference added meanwhile by another upload keeps the blob
+    deleted = db.query(ImageBlob).filter(ImageBlob.digest == digest, ImageBlob.ref_count <= 0).delete(
+        synchronize_session=False)
+    return meta.get('keys', []) if deleted else []
+
+
+def delete_objects(keys):
+    """ Best-effort removal from storage (a leftover object is only wasted space). """
+    for key in keys:
+        try:
+            storage().delete(key)
+        except Exception:
+            pass
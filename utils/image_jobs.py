@@ -0,0 +1,260 @@
+"""
+Background image uploads: the request spools the files to disk, records an ImageJob and
+returns 202; a bounded worker pool processes the job (utils/images.process_images), inserts
+the PropertyImage rows in one batch and records per-file results on the job.
+
+Jobs live in the DB, so any worker process can report their status; the pool and its
+queue are per process. A job interrupted by a restart or a crash stops sending heartbeats:
+after IMAGE_JOB_STALE_SECONDS it is failed and its spooled files are removed (fail_stale, run
+at startup and when the job is polled).
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from PIL import UnidentifiedImageError
+from sqlalchemy import func
+
+from config import Config
+from database import get_db
+from models import ImageJob, PropertyImage
+from utils import image_blobs, search_cache
+from utils.images import process_images
+from utils.property_cards import refresh_card
+from utils.uploads import LimitedSpool
+
+
+# Progress of a running job is written at most this often (seconds)
+PROGRESS_INTERVAL = 1.0
+
+_executor = ThreadPoolExecutor(max_workers=Config.IMAGE_JOB_WORKERS, thread_name_prefix='image-job')
+_pending = set()  # ids of the jobs queued or running in this process
+_lock = threading.Lock()
+
+
+def has_capacity():
+    with _lock:
+        return len(_pending) < Config.IMAGE_JOB_MAX_PENDING
+
+
+def _now():
+    # Naive UTC, like the DateTime columns store it
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _remove_spool(job_id, count):
+    for i in range(count):
+        try:
+            os.remove(_spool_path(job_id, i))
+        except OSError:
+            pass
+
+
+def _spool_path(job_id, index):
+    return os.path.join(Config.IMAGE_SPOOL_DIR, f'{job_id}-{index}')
+
+
+def create_job(db, property_id, user_id, files):
+    """ Moves the uploaded files (FileStorage) into the spool and records a queued job. """
+    job_id = uuid.uuid4().hex
+    os.makedirs(Config.IMAGE_SPOOL_DIR, exist_ok=True)
+    for i, f in enumerate(files):
+        if isinstance(f.stream, LimitedSpool):
+            f.stream.move_to(_spool_path(job_id, i))
+        else:
+            f.save(_spool_path(job_id, i))
+
+    job = ImageJob(
+        id=job_id,
+        property_id=property_id,
+        user_id=user_id,
+        status='queued',
+        files=[{'filename': getattr(f, 'filename', None), 'status': 'pending'} for f in files],
+        heartbeat_at=_now(),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def submit(job_id):
+    """ Queues a created job on the worker pool. """
+    with _lock:
+        _pending.add(job_id)
+    _executor.submit(_run_queued, job_id)
+
+
+def _run_queued(job_id):
+    try:
+        run(job_id)
+    finally:
+        with _lock:
+            _pending.discard(job_id)
+
+
+def _error_message(e):
+    # Pillow names the spooled file in its message
+    if isinstance(e, UnidentifiedImageError):
+        return 'cannot identify image file'
+    return str(e)
+
+
+def _insert_images(db, property_id, files, results, claimed):
+    """ Adds a PropertyImage (and its blob reference) per processed file and marks the files succeeded. """
+    base_sort = (
+        db.query(func.coalesce(func.max(PropertyImage.sort_order), -1))
+        .filter(PropertyImage.property_id == property_id)
+        .scalar()
+    ) + 1
+    has_any = db.query(PropertyImage.id).filter_by(property_id=property_id).first() is not None
+
+    added = []
+    for i, meta in enumerate(results):
+        if isinstance(meta, Exception):
+            continue
+        img = PropertyImage(
+            property_id=property_id,
+            storage_key=meta.get("storage_key"),  # Medium version (relative) key for reference
+            digest=meta.get("digest"),
+            url=meta.get("url"),
+            thumb_url=meta.get("thumb_url"),
+            large_url=meta.get("large_url"),
+            width=meta.get("width"),
+            height=meta.get("height"),
+            bytes=meta.get("bytes"),
+            format=meta.get("format"),
+            is_cover=not has_any,
+            sort_order=base_sort + i,
+        )
+        has_any = True
+        db.add(img)
+        added.append((i, img))
+
+    if added:
+        image_blobs.acquire(db, [results[i] for i, _ in added], claimed)
+        refresh_card(db, property_id)  # flushes the new rows
+    for i, img in added:
+        files[i].update(status='succeeded', id=img.id, url=img.url)
+    return len(added)
+
+
+def run(job_id):
+    """ Processes a job (in a pool worker, or inline for synchronous uploads). """
+    with get_db() as db:
+        job = db.get(ImageJob, job_id)
+        if job is None or job.status != 'queued':
+            return
+        job.status = 'running'
+        job.heartbeat_at = _now()
+        db.commit()
+
+        property_id = job.property_id
+        files = [dict(f) for f in job.files]
+        paths = [_spool_path(job_id, i) for i in range(len(files))]
+        last_write = [time.monotonic()]
+
+        def on_done(i, result):
+            if isinstance(result, Exception):
+                files[i].update(status='failed', error=_error_message(result))
+            else:
+                files[i]['status'] = 'processed'
+            if time.monotonic() - last_write[0] >= PROGRESS_INTERVAL:
+                job.files = [dict(f) for f in files]
+                job.heartbeat_at = _now()
+                db.commit()
+                last_write[0] = time.monotonic()
+
+        claimed = {}
+
+        def known(digests):
+            # References on the reused blobs are taken (and committed) right away
+            claimed.update(image_blobs.claim(db, digests))
+            return claimed
+
+        inserted, metrics = 0, None
+        try:
+            results, metrics = process_images(paths, on_done, known=known)
+            inserted = _insert_images(db, property_id, files, results, claimed)
+            job.status = 'done'
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            # Give back the claimed references; the blobs may be unused now
+            keys = [key for digest in claimed for key in image_blobs.release(db, digest)]
+            db.commit()
+            image_blobs.delete_objects(keys)
+            inserted = 0
+            for f in files:
+                if f['status'] != 'failed':
+                    f.update(status='failed', error=_error_message(e))
+                    f.pop('id', None)
+                    f.pop('url', None)
+            job.status = 'failed'
+        finally:
+            _remove_spool(job_id, len(paths))
+
+        job.files = files
+        job.metrics = metrics
+        job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+    if inserted:
+        # Cached search pages carry the cover URL
+        search_cache.invalidate_property(property_id)
+
+
+def fail_stale(db, job_ids=None):
+    """
+    Fails the queued/running jobs (all, or those of job_ids) whose heartbeat is older than
+    IMAGE_JOB_STALE_SECONDS: their worker was restarted or died, nothing will finish them.
+    Their unfinished files are reported as failed and the spooled files removed.
+    Returns the number of jobs failed.
+    """
+    cutoff = _now() - timedelta(seconds=Config.IMAGE_JOB_STALE_SECONDS)
+    last_seen = func.coalesce(ImageJob.heartbeat_at, ImageJob.created_at)
+    stale = db.query(ImageJob.id, ImageJob.status, ImageJob.files).filter(
+        ImageJob.status.in_(('queued', 'running')), last_seen < cutoff
+    )
+    if job_ids is not None:
+        stale = stale.filter(ImageJob.id.in_(job_ids))
+
+    failed = []
+    for job_id, status, files in stale.all():
+        files = [
+            f if f['status'] in ('succeeded', 'failed')
+            else {'filename': f['filename'], 'status': 'failed', 'error': 'upload interrupted, please retry'}
+            for f in files
+        ]
+        # Conditional, in case the job's worker reported progress meanwhile
+        updated = db.query(ImageJob).filter(
+            ImageJob.id == job_id, ImageJob.status == status, last_seen < cutoff
+        ).update({
+            ImageJob.status: 'failed', ImageJob.files: files, ImageJob.finished_at: datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        if updated:
+            failed.append((job_id, len(files)))
+    db.commit()
+
+    for job_id, count in failed:
+        _remove_spool(job_id, count)
+    return len(failed)
+
+
+def job_to_dict(job):
+    files = job.files or []
+    return {
+        'job_id': job.id,
+        'property_id': job.property_id,
+        'status': job.status,
+        'total': len(files),
+        'processed': sum(f['status'] != 'pending' for f in files),
+        'succeeded': [{'id': f['id'], 'url': f['url']} for f in files if f['status'] == 'succeeded'],
+        'failed': [{'filename': f['filename'], 'error': f.get('error')} for f in files if f['status'] == 'failed'],
+        'files': files,
+        'metrics': job.metrics,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -1,58 +1,131 @@
-import io, uuid
-from PIL import Image, ImageOps, Image as PILImage
+import io, os, time, hashlib, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from PIL import ExifTags, Image, ImageOps, Image as PILImage
+try:
+    # HEIC/HEIF uploads (iPhone photos); decoded at full size, pillow-heif has no draft mode
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
 from config import Config
-from utils.r2 import r2_client
+from utils.storage import storage
 
-def _save_variant_to_bytes(img: PILImage.Image, max_px: int):
-    out = img.copy()
-    out.thumbnail((max_px, max_px), resample=Image.Resampling.LANCZOS)
+
+# Variant name -> longest side (px)
+VARIANTS = {"thumb": 240, "medium": 800, "large": 1600}
+
+# CPU-bound encoding runs in worker processes, uploads in threads sharing the process-wide
+# storage driver. Both pools are created on first use.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _encode_pool():
+    if Config.IMAGE_ENCODE_WORKERS <= 0:
+        return None
+    with _pools_lock:
+        if "encode" not in _pools:
+            # spawn: forking a threaded server process is unsafe. Each worker imports the main
+            # module again; app.py skips its startup work there (__mp_main__)
+            _pools["encode"] = ProcessPoolExecutor(
+                max_workers=Config.IMAGE_ENCODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pools["encode"]
+
+
+def _upload_pool():
+    with _pools_lock:
+        if "upload" not in _pools:
+            _pools["upload"] = ThreadPoolExecutor(
+                max_workers=Config.IMAGE_UPLOAD_WORKERS, thread_name_prefix="image-upload"
+            )
+        return _pools["upload"]
+
+
+# EXIF orientations that swap width and height
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _encode_webp(img: PILImage.Image):
     buf = io.BytesIO()
-    out.save(buf, format="WEBP", method=5, quality=82, optimize=True)
+    img.save(buf, format="WEBP", method=5, quality=82, optimize=True)
     data = buf.getvalue()
     buf.close()
-    out.close()
-    return data, out.width, out.height, len(data)
-
-def _normalize_image(img: PILImage.Image) -> PILImage.Image:
-    img = ImageOps.exif_transpose(img)
-    if "exif" in img.info:
-        img.info.pop("exif", None)
-    return img
-
-def process_image(file_storage, property_id: int):
-    if not Config.USE_R2:
-        raise RuntimeError("R2 is required; set USE_R2=true")
-
-
-    img = Image.open(file_storage.stream)
-    img = ImageOps.exif_transpose(img).convert('RGB')
-    img = _normalize_image(img)
-
-    uid = uuid.uuid4().hex
-    base_key = f"property/{property_id}/{uid}"
-    variants = {"thumb": 240, "medium": 800, "large": 1600}
-
-    s3 = r2_client()
-    saved = {}
-    for name, px in variants.items():
-        data, w, h, size_bytes = _save_variant_to_bytes(img, px)
-        key = f"{base_key}/{name}.webp"
-        s3.put_object(
-            Bucket=Config.R2_BUCKET_NAME,
-            Key=key,
-            Body=data,
-            ContentType="image/webp",
-            CacheControl="public, max-age=31536000, immutable",
-        )
-        saved[name] = {
-            "key": key,
-            "url": f"{Config.R2_PUBLIC_BASE_URL}/{key}",
+    return data, img.width, img.height, len(data)
+
+def _decode(source, max_px: int):
+    """
+    Opens the source and decodes it once, upright and in RGB. JPEGs are decoded in draft
+    mode at the smallest DCT scale still covering max_px (e.g. 1/4 of a 40 MP photo) instead
+    of at full resolution. Returns (image, original width, original height).
+    """
+    img = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    width, height = img.size
+    if img.getexif().get(ExifTags.Base.Orientation) in _ROTATED_ORIENTATIONS:
+        width, height = height, width
+
+    img.draft("RGB", (max_px, max_px))
+    ImageOps.exif_transpose(img, in_place=True)
+    if img.mode != "RGB":
+        rgb = img.convert("RGB")
+        img.close()
+        img = rgb
+    img.info.pop("exif", None)
+    return img, width, height
+
+def encode_variants(source):
+    """
+    Decodes the source image (bytes, or the path of a spooled file) and encodes every WebP
+    variant (runs in a worker process). The image is decoded once near the largest variant's
+    size, then shrunk in place from one variant to the next (large -> medium -> thumb), so
+    no full-size copy is made.
+    Returns (width, height, {name: (bytes, width, height, size)}, seconds spent).
+    """
+    started = time.perf_counter()
+    sizes = sorted(VARIANTS.items(), key=lambda item: item[1], reverse=True)
+    img, width, height = _decode(source, sizes[0][1])
+
+    variants = {}
+    for name, px in sizes:
+        img.thumbnail((px, px), resample=Image.Resampling.LANCZOS)
+        variants[name] = _encode_webp(img)
+    img.close()
+    return width, height, {name: variants[name] for name in VARIANTS}, time.perf_counter() - started
+
+
+def _upload(key: str, data: bytes):
+    started = time.perf_counter()
+    storage().put(key, data, "image/webp")
+    return time.perf_counter() - started
+
+
+def _digest(source):
+    """ SHA-256 of the source bytes (or of the spooled file at that path). """
+    if not isinstance(source, str):
+        return hashlib.sha256(source).hexdigest()
+    h = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _meta(digest: str, width: int, height: int, variants: dict):
+    base_key = f"images/{digest}"
+    saved = {
+        name: {
+            "key": f"{base_key}/{name}.webp",
+            "url": storage().url(f"{base_key}/{name}.webp"),
             "width": w, "height": h, "bytes": size_bytes
         }
-
+        for name, (_, w, h, size_bytes) in variants.items()
+    }
     return {
-        "width": img.width,
-        "height": img.height,
+        "digest": digest,
+        "width": width,
+        "height": height,
         "bytes": saved["medium"]["bytes"],
         "format": "webp",
         "storage_key": saved["medium"]["key"],
@@ -60,4 +133,87 @@ def process_image(file_storage, property_id: int):
         "url": saved["medium"]["url"],
         "large_url": saved["large"]["url"],
         "rel_medium": saved["medium"]["key"],
+        "keys": [variant["key"] for variant in saved.values()],
     }
+
+
+def process_images(sources, on_done=None, known=None):
+    """
+    Pipelined processing of a batch of uploads. sources: list of raw file bytes or paths.
+    Storage keys are content-addressed (images/<sha256 of the source>/<variant>.webp), so
+    identical files are encoded once per batch, and files already stored (known(digests)
+    returns {digest: meta} of the stored ones) are not encoded or uploaded at all.
+    The other files are encoded in parallel (process pool); each file's variants go to the
+    upload thread pool as soon as its encoding is done, while the rest are still encoding.
+    Returns (results, metrics): results[i] is the metadata dict of sources[i] or the
+    exception it failed with; metrics describe the batch's throughput.
+    on_done(i, result) is called as each file finishes.
+    """
+    started = time.perf_counter()
+    results = [None] * len(sources)
+
+    def done(indexes, result):
+        for i in indexes:
+            results[i] = result
+            if on_done:
+                on_done(i, result)
+
+    by_digest = {}
+    for i, source in enumerate(sources):
+        by_digest.setdefault(_digest(source), []).append(i)
+    stored = known(list(by_digest)) if known and by_digest else {}
+    for digest, meta in stored.items():
+        done(by_digest.pop(digest), meta)
+
+    encoder, uploader = _encode_pool(), _upload_pool()
+    # Without worker processes (IMAGE_ENCODE_WORKERS=0) files are encoded by the upload threads
+    encodings = {(encoder or uploader).submit(encode_variants, sources[indexes[0]]): digest
+                 for digest, indexes in by_digest.items()}
+
+    encode_seconds, output_bytes, uploads = 0.0, 0, {}
+    for future in as_completed(encodings):
+        digest = encodings[future]
+        try:
+            width, height, variants, seconds = future.result()
+        except Exception as e:
+            done(by_digest[digest], e)
+            continue
+        encode_seconds += seconds
+        output_bytes += sum(variant[3] for variant in variants.values())
+        uploads[digest] = (
+            [uploader.submit(_upload, f"images/{digest}/{name}.webp", variant[0])
+             for name, variant in variants.items()],
+            _meta(digest, width, height, variants),
+        )
+
+    if any(isinstance(r, BrokenProcessPool) for r in results):
+        # A worker died (e.g. out of memory): start a fresh pool for the next batch
+        with _pools_lock:
+            if _pools.get("encode") is encoder:
+                del _pools["encode"]
+        encoder.shutdown(wait=False)
+
+    upload_seconds = 0.0
+    for digest, (futures, meta) in uploads.items():
+        try:
+            upload_seconds += sum(f.result() for f in futures)
+        except Exception as e:
+            meta = e
+        done(by_digest[digest], meta)
+
+    wall = time.perf_counter() - started
+    input_bytes = sum(os.path.getsize(s) if isinstance(s, str) else len(s) for s in sources)
+    metrics = {
+        "files": len(sources),
+        "failed": sum(isinstance(r, Exception) for r in results),
+        "deduplicated": len(sources) - len(encodings),
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "encode_seconds": round(encode_seconds, 3),
+        "upload_seconds": round(upload_seconds, 3),
+        "wall_seconds": round(wall, 3),
+        "files_per_second": round(len(sources) / wall, 2) if wall else None,
+        "input_mb_per_second": round(input_bytes / wall / 1e6, 2) if wall else None,
+    }
+    return results, metrics
+
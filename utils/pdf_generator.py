@@ -1,21 +1,47 @@
 import io
+import os
+import threading
+
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 
 
-def generate_voucher_pdf(booking, guest_info, property_):
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
+LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'logo.png')
+
+# Embed images as binary streams: ASCII85-encoding the logo took most of the render time.
+rl_config.useA85 = 0
+
+# Name of the form XObject holding the static part of the page (logo, title, divider)
+_STATIC_FORM = 'voucher_static'
 
+# The logo is read and decoded once per process (None when it can't be loaded)
+_assets = {}
+_assets_lock = threading.Lock()
+
+
+def _logo():
+    with _assets_lock:
+        if 'logo' not in _assets:
+            try:
+                logo = ImageReader(LOGO_PATH)
+                logo.getRGBData()  # decode now, not on every page
+            except Exception:
+                logo = None
+            _assets['logo'] = logo
+        return _assets['logo']
+
+
+def _define_static_layer(p):
+    """ Draws the static layer once per document as a form; every page then references it. """
     width, height = A4
+    p.beginForm(_STATIC_FORM)
 
-    # Add logo (path to physical file or BytesIO)
-    logo_path = "static/logo.png"
-    try:
-        p.drawImage(ImageReader(logo_path), 50, height - 100, width=120, height=50, mask='auto')
-    except Exception:
-        pass
+    # Add logo
+    logo = _logo()
+    if logo is not None:
+        p.drawImage(logo, 50, height - 100, width=120, height=50, mask='auto')
 
     # title
     p.setFont("Helvetica-Bold", 18)
@@ -24,9 +50,10 @@ def generate_voucher_pdf(booking, guest_info, property_):
     # divider line
     p.line(50, height - 100, width - 50, height - 100)
 
-    p.setFont("Helvetica", 12)
-    y = height - 130
+    p.endForm()
+
 
+def _voucher_lines(booking, guest_info, property_):
     lines = [
         f"Booking ID: {booking.id}",
         f"Guest: {guest_info.get('first_name', '')} {guest_info.get('last_name', '')}",
@@ -44,12 +71,41 @@ def generate_voucher_pdf(booking, guest_info, property_):
         f"Check-out: {booking.check_out}",
         f"Total Price: ${booking.total_price:.2f}"
     ])
+    return lines
 
-    for line in lines:
-        p.drawString(70, y, line)
-        y -= 20
 
+def _draw_page(p, booking, guest_info, property_):
+    """ One voucher page: the static form plus the booking's text. """
+    _, height = A4
+    p.doForm(_STATIC_FORM)
+
+    text = p.beginText(70, height - 130)
+    text.setFont("Helvetica", 12)
+    text.setLeading(20)
+    text.textLines(_voucher_lines(booking, guest_info, property_))
+    p.drawText(text)
     p.showPage()
+
+
+def render_voucher_batch(vouchers):
+    """
+    Renders many vouchers into one multi-page PDF (one page each).
+    vouchers: iterable of (booking, guest_info, property_). Returns a BytesIO.
+    """
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    _define_static_layer(p)
+    for booking, guest_info, property_ in vouchers:
+        _draw_page(p, booking, guest_info, property_)
     p.save()
     buffer.seek(0)
     return buffer
+
+
+def render_vouchers(vouchers):
+    """ Renders one PDF per (booking, guest_info, property_); returns a list of BytesIO. """
+    return [render_voucher_batch([voucher]) for voucher in vouchers]
+
+
+def generate_voucher_pdf(booking, guest_info, property_):
+    return render_voucher_batch([(booking, guest_info, property_)])
@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from models import PricingRule
+
+
+# Nights priced with weekend_price (date.weekday(): Friday, Saturday)
+WEEKEND_NIGHTS = (4, 5)
+
+_ONE_DAY = timedelta(days=1)
+
+
+def rules_for(db, property_ids=None, start=None, end=None):
+    """
+    Rules of the given properties (all properties when None) overlapping [start, end)
+    (whole span when no range), in one query: {property_id: [PricingRule]}.
+    """
+    result = {pid: [] for pid in property_ids or ()}
+    q = db.query(PricingRule)
+    if property_ids is not None:
+        if not property_ids:
+            return result
+        q = q.filter(PricingRule.property_id.in_(list(property_ids)))
+    if start is not None:
+        q = q.filter(PricingRule.end_date >= start)
+    if end is not None:
+        q = q.filter(PricingRule.start_date < end)
+    for rule in q.order_by(PricingRule.id):
+        result.setdefault(rule.property_id, []).append(rule)
+    return result
+
+
+def overlapping_rule_properties(start, end):
+    """ SELECT of the property ids having a rule that overlaps [start, end) (for IN / NOT IN). """
+    return select(PricingRule.property_id).where(PricingRule.end_date >= start, PricingRule.start_date < end)
+
+
+def expand_rules(rules, start=None, end=None):
+    """
+    Expands rules into {date: (price, is_available)} over [start, end) (their whole span
+    when no range). Blocks win over prices; among price rules the most recent one wins.
+    """
+    nights = {}
+    for rule in sorted(rules, key=lambda r: (r.is_blocked, r.id)):
+        day = rule.start_date if start is None else max(rule.start_date, start)
+        last = rule.end_date if end is None else min(rule.end_date, end - _ONE_DAY)
+        while day <= last:
+            if rule.is_blocked:
+                nights[day] = (0.0, False)
+            elif rule.weekend_price is not None and day.weekday() in WEEKEND_NIGHTS:
+                nights[day] = (float(rule.weekend_price), True)
+            else:
+                nights[day] = (float(rule.price), True)
+            day += _ONE_DAY
+    return nights
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+
+from models import Property, PropertyImage, PropertyCard
+
+
+def refresh_card(db, property_id):
+    """
+    Recomputes the card of a property from Property and PropertyImage rows.
+    Call it in the transaction that changes them; the caller commits.
+    """
+    # Sessions don't autoflush; make the pending image changes visible to the queries below.
+    db.flush()
+    prop = db.get(Property, property_id)
+    if prop is None:
+        card = db.get(PropertyCard, property_id)
+        if card is not None:
+            db.delete(card)
+        return None
+
+    # Cover: the image flagged as cover, otherwise the first one by sort order.
+    cover = (
+        db.query(PropertyImage.url, PropertyImage.thumb_url)
+        .filter(PropertyImage.property_id == property_id)
+        .order_by(
+            PropertyImage.is_cover.desc(),
+            PropertyImage.sort_order.asc(),
+            PropertyImage.id.asc()
+        )
+        .first()
+    )
+    image_count = (
+        db.query(func.count(PropertyImage.id))
+        .filter(PropertyImage.property_id == property_id)
+        .scalar()
+    )
+
+    card = db.get(PropertyCard, property_id) or PropertyCard(property_id=property_id)
+    card.host_id = prop.host_id
+    card.title = prop.title
+    card.location = prop.location
+    card.description = prop.description
+    card.is_approved = prop.is_approved
+    card.cover_url = cover.url if cover else None
+    card.thumb_url = cover.thumb_url if cover else None
+    card.image_count = image_count
+    card.updated_at = datetime.now(timezone.utc)
+    db.add(card)
+    return card
+
+
+def backfill_cards(db):
+    """ Creates the missing cards (startup). """
+    missing = (
+        db.query(Property.id)
+        .outerjoin(PropertyCard, PropertyCard.property_id == Property.id)
+        .filter(PropertyCard.property_id.is_(None))
+        .all()
+    )
+    for (pid,) in missing:
+        refresh_card(db, pid)
+    if missing:
+        db.commit()
@@ -1,3 +1,5 @@
+import threading
+
 import boto3
 from botocore.config import Config as BotoCfg
 from config import Config
@@ -13,12 +15,24 @@ _BOTO_CFG = BotoCfg(
 )
 
 
+_client = None
+_client_lock = threading.Lock()
+
+
 def r2_client():
-    return boto3.client(
-        "s3",
-        endpoint_url=Config.R2_ENDPOINT,
-        aws_access_key_id=Config.R2_ACCESS_KEY_ID,
-        aws_secret_access_key=Config.R2_SECRET_ACCESS_KEY,
-        region_name="auto",
-        config=_BOTO_CFG,
-    )
\ No newline at end of file
+    """
+    The process-wide S3 client. boto3 clients are thread-safe, so every caller shares one
+    client and its connection pool (max_pool_connections) instead of a new one per call.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = boto3.client(
+                "s3",
+                endpoint_url=Config.R2_ENDPOINT,
+                aws_access_key_id=Config.R2_ACCESS_KEY_ID,
+                aws_secret_access_key=Config.R2_SECRET_ACCESS_KEY,
+                region_name="auto",
+                config=_BOTO_CFG,
+            )
+        return _client
@@ -0,0 +1,366 @@
+import heapq
+from itertools import accumulate
+
+from sqlalchemy import and_, case, func, select
+
+from models import Property, Availability, PropertyCard
+from utils import availability_index, text_index
+from utils.pricing_rules import rules_for, expand_rules, overlapping_rule_properties
+
+
+# A night can be sold only when it is available, not reserved and not blocked
+# (is_blocked is nullable, NULL counts as "not blocked").
+BOOKABLE = and_(
+    Availability.is_available == True,
+    Availability.is_reserved == False,
+    Availability.is_blocked.isnot(True),
+)
+
+
+def is_bookable(night):
+    """ Python version of BOOKABLE, for a loaded Availability row (the booking check). """
+    return bool(night.is_available and not night.is_reserved and not night.is_blocked)
+
+
+def candidate_query(db, location=None, title=None):
+    """
+    Properties matching the location/title filters (only the columns a search item needs).
+    Substring filters are resolved to ids by the trigram index when possible.
+    """
+    q = db.query(Property.id, Property.title, Property.location)
+    ids = text_index.match(db, location=location, title=title) if text_index.enabled() else None
+    if ids is not None:
+        q = q.filter(Property.id.in_(sorted(ids)))
+    for column, value in ((Property.location, location), (Property.title, title)):
+        if value and (ids is None or not text_index.resolvable(value)):
+            q = q.filter(column.ilike(f"%{value.strip()}%"))
+    return q
+
+
+# Supported `sort` values of iter_page (ascending, ties broken by property id).
+SORTS = ('total_price', 'price_per_night')
+
+
+def iter_page(db, check_in, check_out, location=None, title=None, include_partial=False,
+              min_price=None, max_price=None, sort=None,
+              after_id=None, offset=0, limit=50, chunk_size=100):
+    """
+    Yields one search page in chunks of
+    (id, title, location, bookable_nights, total_price, calendar_version) rows.
+    - total_price only sums the bookable nights; min_price/max_price filter on it.
+    - If include_partial=False, properties with an unavailable night are skipped before
+      counting the page (offset/limit apply to matching properties).
+    - Without `sort`, rows are ordered by property id and candidates are walked with keyset
+      pagination (after_id is the id of the last property of the previous page), so a chunk
+      can be serialized before the next one is evaluated.
+    - With sort='total_price' or 'price_per_night' (average of the bookable nights), only
+      offset/limit apply and the page comes as a single chunk.
+    """
+    filters = (location, title, include_partial, min_price, max_price)
+    if sort:
+        if availability_index.enabled():
+            yield _top_indexed(db, check_in, check_out, filters, sort, offset, limit)
+        else:
+            yield _top_sql(db, check_in, check_out, filters, sort, offset, limit)
+        return
+
+    if availability_index.enabled():
+        chunks = _iter_indexed(db, check_in, check_out, filters, after_id, offset)
+    else:
+        chunks = _iter_sql(db, check_in, check_out, filters, after_id, offset, min(limit, chunk_size))
+
+    remaining = limit
+    for chunk in chunks:
+        if len(chunk) >= remaining:
+            yield chunk[:remaining]
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _sql_base(db, check_in, check_out, filters):
+    """
+    Candidates with their bookable nights and total price, computed per candidate by
+    correlated subqueries over the bookable rows of the range (covered by the partial index
+    ix_availability_bookable), so only the candidates' rows are read, as far as the keyset
+    chunk or LIMIT goes. Returns (query, bookable_nights column, total_price column).
+    """
+    location, title, include_partial, min_price, max_price = filters
+    total_nights = (check_out - check_in).days
+
+    bookable = (
+        Availability.property_id == Property.id,
+        Availability.date >= check_in,
+        Availability.date < check_out,
+        BOOKABLE,
+    )
+    bookable_nights = select(func.count()).where(*bookable).correlate(Property).scalar_subquery()
+    total_price = (
+        select(func.coalesce(func.sum(Availability.price), 0)).where(*bookable)
+        .correlate(Property).scalar_subquery()
+    )
+
+    q = (
+        candidate_query(db, location, title)
+        .add_columns(bookable_nights, total_price, Property.calendar_version)
+        # Properties with pricing rules in the range are evaluated by _rule_rows
+        .filter(Property.id.notin_(overlapping_rule_properties(check_in, check_out)))
+    )
+    if not include_partial:
+        q = q.filter(bookable_nights == total_nights)
+    if min_price is not None:
+        q = q.filter(total_price >= min_price)
+    if max_price is not None:
+        q = q.filter(total_price <= max_price)
+    return q, bookable_nights, total_price
+
+
+def _matches(filters, total_nights, nights, total):
+    """ Python version of the include_partial/min_price/max_price filters. """
+    _, _, include_partial, min_price, max_price = filters
+    if not include_partial and nights != total_nights:
+        return False
+    if min_price is not None and total < min_price:
+        return False
+    if max_price is not None and total > max_price:
+        return False
+    return True
+
+
+def _rule_rows(db, check_in, check_out, filters, after_id=None, chunk_size=100):
+    """
+    Matching candidates whose range is (partly) priced by pricing rules, evaluated in Python
+    from night_map (rules expanded, rows override). Yielded in property id order: the
+    candidates after `after_id` are read and evaluated in keyset chunks of chunk_size, so a
+    caller that stops early (a full page) never evaluates the rest.
+    """
+    location, title = filters[:2]
+    total_nights = (check_out - check_in).days
+    base = (
+        candidate_query(db, location, title)
+        .add_columns(Property.calendar_version)
+        .filter(Property.id.in_(overlapping_rule_properties(check_in, check_out)))
+    )
+    last_id = after_id
+    while True:
+        q = base if last_id is None else base.filter(Property.id > last_id)
+        candidates = q.order_by(Property.id).limit(chunk_size).all()
+        nights = night_map(db, [row[0] for row in candidates], check_in, check_out,
+                           {row[0]: row[3] for row in candidates})
+
+        for pid, p_title, p_location, version in candidates:
+            sellable = [price for price, is_avail in nights[pid].values() if is_avail]
+            if _matches(filters, total_nights, len(sellable), sum(sellable)):
+                yield pid, p_title, p_location, len(sellable), sum(sellable), version
+        if len(candidates) < chunk_size:
+            return
+        last_id = candidates[-1][0]
+
+
+def _iter_sql(db, check_in, check_out, filters, after_id, offset, chunk_size):
+    """
+    Chunks of matches in property id order: plain calendars are evaluated in SQL (keyset
+    chunks) and merged with the rule-priced properties.
+    """
+    base = _sql_base(db, check_in, check_out, filters)[0]
+
+    def sql_rows():
+        last_id = after_id
+        while True:
+            q = base if last_id is None else base.filter(Property.id > last_id)
+            rows = q.order_by(Property.id).limit(chunk_size).all()
+            yield from (tuple(row) for row in rows)
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+    ruled = _rule_rows(db, check_in, check_out, filters, after_id, chunk_size)
+
+    chunk = []
+    for row in heapq.merge(sql_rows(), ruled, key=lambda r: r[0]):
+        if offset:
+            offset -= 1
+            continue
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _sort_key(sort):
+    """ Python equivalent of the SQL ordering of _top_sql. """
+    if sort == 'price_per_night':
+        def key(row):
+            return (row[3] == 0, float(row[4]) / row[3] if row[3] else 0.0, row[0])
+    else:
+        def key(row):
+            return (float(row[4]), row[0])
+    return key
+
+
+def _top_sql(db, check_in, check_out, filters, sort, offset, limit):
+    """ One sorted page; plain calendars are sorted and cut in SQL, then merged with the rule-priced ones. """
+    q, bookable_nights, total_price = _sql_base(db, check_in, check_out, filters)
+    if sort == 'price_per_night':
+        # Properties without a bookable night go last.
+        order = (case((bookable_nights == 0, 1), else_=0),
+                 total_price * 1.0 / func.nullif(bookable_nights, 0))
+    else:
+        order = (total_price,)
+    rows = [tuple(row) for row in q.order_by(*order, Property.id).limit(offset + limit).all()]
+
+    key = _sort_key(sort)
+    # Sorted by a price computed in Python: every rule-priced candidate is evaluated, a chunk
+    # at a time, keeping the offset + limit smallest
+    ruled = heapq.nsmallest(offset + limit, _rule_rows(db, check_in, check_out, filters), key=key)
+    return list(heapq.merge(rows, ruled, key=key))[offset:offset + limit]
+
+
+def _iter_indexed(db, check_in, check_out, filters, after_id, offset, chunk_size=500):
+    """ Chunks of matches in property id order, summaries come from the availability index. """
+    location, title = filters[:2]
+    total_nights = (check_out - check_in).days
+
+    for candidates in iter_candidates(db, location, title, after_id, chunk_size):
+        calendars = availability_index.load(db, {row[0]: row[3] for row in candidates})
+
+        matches = []
+        for pid, p_title, p_location, version in candidates:
+            nights, total = calendars[pid].summary(check_in, check_out)
+            if not _matches(filters, total_nights, nights, total):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            matches.append((pid, p_title, p_location, nights, total, version))
+        if matches:
+            yield matches
+
+
+def iter_candidates(db, location=None, title=None, after_id=None, chunk_size=500):
+    """ Chunks of (id, title, location, calendar_version) candidate rows, keyset-paginated by id. """
+    base = candidate_query(db, location, title).add_columns(Property.calendar_version)
+
+    last_id = after_id
+    while True:
+        q = base if last_id is None else base.filter(Property.id > last_id)
+        candidates = q.order_by(Property.id).limit(chunk_size).all()
+        if candidates:
+            yield candidates
+        if len(candidates) < chunk_size:
+            return
+        last_id = candidates[-1][0]
+
+
+def _top_indexed(db, check_in, check_out, filters, sort, offset, limit):
+    """ One sorted page, selected with a bounded heap of offset + limit rows. """
+    key = _sort_key(sort)
+    matches = (row for chunk in _iter_indexed(db, check_in, check_out, filters, None, 0) for row in chunk)
+    return heapq.nsmallest(offset + limit, matches, key=key)[offset:]
+
+
+def window_arrays(db, candidates, start, end):
+    """
+    Nightly arrays of the candidates over [start, end), loaded once per property:
+    {property_id: (prices, bookable)} where prices[i] is the price of night start+i when it is
+    bookable (0.0 otherwise) and bookable[i] is 1/0.
+    """
+    days = (end - start).days
+    if availability_index.enabled():
+        calendars = availability_index.load(db, {row[0]: row[3] for row in candidates})
+        return {pid: cal.window(start, end) for pid, cal in calendars.items()}
+
+    result = {}
+    nights = night_map(db, [row[0] for row in candidates], start, end)
+    for pid, by_date in nights.items():
+        prices, bookable = [0.0] * days, [0] * days
+        for day, (price, is_avail) in by_date.items():
+            if is_avail:
+                prices[(day - start).days] = price
+                bookable[(day - start).days] = 1
+        result[pid] = (prices, bookable)
+    return result
+
+
+def cheapest_stays(prices, bookable, nights, top):
+    """
+    The `top` cheapest fully bookable stays of `nights` nights, as (start offset, total) pairs.
+    Prefix sums turn every sliding window into two subtractions.
+    """
+    price_sums = list(accumulate(prices, initial=0.0))
+    bookable_sums = list(accumulate(bookable, initial=0))
+    valid = (
+        (i, price_sums[i + nights] - price_sums[i])
+        for i in range(len(prices) - nights + 1)
+        if bookable_sums[i + nights] - bookable_sums[i] == nights
+    )
+    return heapq.nsmallest(top, valid, key=lambda stay: (stay[1], stay[0]))
+
+
+def night_map(db, property_ids, check_in, check_out, versions=None):
+    """
+    Per-night data of the given properties in [check_in, check_out): pricing rules expanded,
+    then overridden by availability rows (one query each).
+    With the availability index, calendars are checked against {property_id: calendar_version}
+    (read from the DB when not given), so a calendar changed by another worker is reloaded.
+    Returns {property_id: {date: (price, is_available)}}; missing dates have no record.
+    """
+    result = {pid: {} for pid in property_ids}
+
+    if availability_index.enabled() and property_ids:
+        if versions is None:
+            versions = dict(
+                db.query(Property.id, Property.calendar_version).filter(Property.id.in_(property_ids))
+            )
+        calendars = availability_index.load(db, {pid: versions[pid] for pid in property_ids if pid in versions})
+        for pid, cal in calendars.items():
+            result[pid] = cal.nights(check_in, check_out)
+        property_ids = [pid for pid in property_ids if pid not in calendars]
+
+    if not property_ids:
+        return result
+
+    for pid, rules in rules_for(db, property_ids, check_in, check_out).items():
+        if rules:
+            result[pid] = expand_rules(rules, check_in, check_out)
+
+    rows = (
+        db.query(
+            Availability.property_id,
+            Availability.date,
+            Availability.price,
+            case((BOOKABLE, True), else_=False),
+        )
+        .filter(
+            Availability.property_id.in_(property_ids),
+            Availability.date >= check_in,
+            Availability.date < check_out,
+        )
+        .all()
+    )
+    for pid, day, price, is_avail in rows:
+        result[pid][day] = (float(price), bool(is_avail))
+    return result
+
+
+def cover_cards(db, property_ids):
+    """
+    {property_id: (cover URL or None, card updated_at)} of the given properties, read from
+    the property cards in one query; updated_at changes whenever the cover does.
+    """
+    if not property_ids:
+        return {}
+
+    rows = (
+        db.query(PropertyCard.property_id, PropertyCard.cover_url, PropertyCard.updated_at)
+        .filter(PropertyCard.property_id.in_(property_ids))
+        .all()
+    )
+    return {pid: (cover_url, updated_at) for pid, cover_url, updated_at in rows}
+
+
+def cover_urls(db, property_ids):
+    """ Cover image URL of each property (see cover_cards). Properties without a cover are missing. """
+    return {pid: url for pid, (url, _) in cover_cards(db, property_ids).items() if url is not None}
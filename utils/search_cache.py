@@ -0,0 +1,98 @@
+"""
+Process-local LRU + TTL cache for /search responses.
+
+Each entry remembers the calendar_version of every property on its page and, when the page
+shows covers, the updated_at of their property cards. A hit is re-validated against the DB
+with one indexed query, so a cached page never offers nights booked since, nor an old cover
+(changed in this or any other process). Writes in this process also drop the entries of the
+touched property right away (see invalidate_property).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from models import Property, PropertyCard
+
+
+# key -> (expires_at, body, next_cursor, {property_id: calendar_version},
+#         {property_id: card updated_at} or None)
+_entries = OrderedDict()
+_by_property = {}         # property_id -> set of keys
+_lock = threading.Lock()
+
+
+def enabled():
+    return Config.SEARCH_CACHE_SIZE > 0
+
+
+def make_key(**params):
+    """ Normalized key of a search: strings are stripped and lowercased, None is dropped. """
+    return tuple(sorted(
+        (name, value.strip().lower() if isinstance(value, str) else value)
+        for name, value in params.items()
+        if value is not None
+    ))
+
+
+def _drop(key):
+    entry = _entries.pop(key, None)
+    if entry is None:
+        return
+    for pid in entry[3]:
+        keys = _by_property.get(pid)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _by_property[pid]
+
+
+def get(db, key):
+    """ Returns (body, next_cursor) or None. """
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            _drop(key)
+            return None
+        _entries.move_to_end(key)
+    expires_at, body, next_cursor, versions, cards = entry
+
+    if versions:
+        rows = (
+            db.query(Property.id, Property.calendar_version, PropertyCard.updated_at)
+            .outerjoin(PropertyCard, PropertyCard.property_id == Property.id)
+            .filter(Property.id.in_(list(versions)))
+            .all()
+        )
+        current = {pid: version for pid, version, _ in rows}
+        stale = current != versions or (
+            cards is not None and {pid: updated_at for pid, _, updated_at in rows} != cards
+        )
+        if stale:
+            with _lock:
+                _drop(key)
+            return None
+    return body, next_cursor
+
+
+def put(key, body, next_cursor, versions, cards=None):
+    """
+    versions: {property_id: calendar_version} of the page; cards: {property_id: card
+    updated_at} when the page shows covers, else None.
+    """
+    with _lock:
+        _drop(key)
+        _entries[key] = (time.monotonic() + Config.SEARCH_CACHE_TTL, body, next_cursor, dict(versions),
+                         dict(cards) if cards is not None else None)
+        for pid in versions:
+            _by_property.setdefault(pid, set()).add(key)
+        while len(_entries) > Config.SEARCH_CACHE_SIZE:
+            _drop(next(iter(_entries)))
+
+
+def invalidate_property(property_id):
+    with _lock:
+        for key in list(_by_property.get(property_id, ())):
+            _drop(key)
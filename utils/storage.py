@@ -0,0 +1,93 @@
+"""
+Image storage backends. `storage()` returns the configured driver:
+
+- R2Storage (USE_R2=true): objects in the R2 bucket, served from R2_PUBLIC_BASE_URL.
+- LocalStorage: files under IMAGE_LOCAL_DIR, served by the app at IMAGE_LOCAL_BASE_URL.
+
+Both take object keys (e.g. images/<sha256>/medium.webp) and hand out public URLs. Objects
+are immutable: a key always names the same bytes, so writes may be repeated safely.
+"""
+import os
+import threading
+
+from config import Config
+
+
+class R2Storage:
+    def __init__(self):
+        from utils.r2 import r2_client  # boto3 is only needed with R2
+        self._client = r2_client
+
+    def put(self, key, data, content_type):
+        self._client().put_object(
+            Bucket=Config.R2_BUCKET_NAME,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            CacheControl="public, max-age=31536000, immutable",
+        )
+
+    def delete(self, key):
+        self._client().delete_object(Bucket=Config.R2_BUCKET_NAME, Key=key)
+
+    def url(self, key):
+        return f"{Config.R2_PUBLIC_BASE_URL}/{key}"
+
+    def key_for_url(self, url):
+        base = Config.R2_PUBLIC_BASE_URL.rstrip('/')
+        if url and url.startswith(base + '/'):
+            return url[len(base) + 1:]
+        return None
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"invalid storage key: {key}")
+        return path
+
+    def put(self, key, data, content_type):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so a half-written file is never served
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def delete(self, key):
+        path = self.path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(path))  # the image's directory, once its last variant is gone
+        except OSError:
+            pass
+
+    def url(self, key):
+        return f"{Config.IMAGE_LOCAL_BASE_URL}/{key}"
+
+    def key_for_url(self, url):
+        base = Config.IMAGE_LOCAL_BASE_URL.rstrip('/')
+        if url and url.startswith(base + '/'):
+            return url[len(base) + 1:]
+        return None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def storage():
+    """ The process-wide storage driver (thread-safe). """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = R2Storage() if Config.USE_R2 else LocalStorage(Config.IMAGE_LOCAL_DIR)
+        return _storage
@@ -0,0 +1,147 @@
+"""
+Process-local trigram index over Property.location and Property.title.
+
+Resolves case-insensitive substring queries (the `ilike('%q%')` filters) to candidate
+property ids without scanning the table. Properties are only ever created in this app,
+so other worker processes' inserts are picked up by loading ids above the highest one seen.
+Ids are assigned at INSERT, not at commit, so a smaller id can commit after a bigger one:
+the ids missing below the highest one are re-checked for GAP_SECONDS (after that they are
+taken for rolled back or deleted; a transaction committing later is only seen at restart).
+"""
+import threading
+import time
+
+from sqlalchemy import func, or_
+
+from config import Config
+from models import Property
+
+
+# Shorter queries have no trigram; the caller falls back to ILIKE.
+MIN_QUERY_LEN = 3
+# Broader matches are left to ILIKE rather than sent as a huge IN list.
+MAX_CANDIDATES = 10000
+# How long ids missing below the highest loaded one are re-checked (seconds), and at most
+# how many of them (the ones closest to the top, where transactions are still in flight)
+GAP_SECONDS = 300
+MAX_GAPS = 1000
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.postings = {}  # trigram -> set of property ids
+        self.texts = {}     # property id -> lowercased text
+
+    def add(self, property_id, text):
+        text = (text or '').lower()
+        self.texts[property_id] = text
+        for gram in _trigrams(text):
+            self.postings.setdefault(gram, set()).add(property_id)
+
+    def match(self, query):
+        """ Ids whose text contains `query` (already lowercased, len >= MIN_QUERY_LEN). """
+        sets = []
+        for gram in _trigrams(query):
+            ids = self.postings.get(gram)
+            if not ids:
+                return set()
+            sets.append(ids)
+        sets.sort(key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+        # Trigrams can match out of order, confirm the substring.
+        return {pid for pid in candidates if query in self.texts[pid]}
+
+
+_indexes = {'location': TrigramIndex(), 'title': TrigramIndex()}
+_state = {'max_id': 0, 'gaps': {}}  # gaps: missing id -> time.monotonic() when first missed
+_lock = threading.Lock()
+
+
+def enabled():
+    return Config.TEXT_INDEX
+
+
+def add_property(property_id, title, location):
+    with _lock:
+        _indexes['title'].add(property_id, title)
+        _indexes['location'].add(property_id, location)
+        gaps = _state['gaps']
+        gaps.pop(property_id, None)
+        if property_id > _state['max_id']:
+            now = time.monotonic()
+            for missing in range(max(_state['max_id'] + 1, property_id - MAX_GAPS), property_id):
+                gaps[missing] = now
+            _state['max_id'] = property_id
+
+
+def sync(db):
+    """
+    Loads properties created since the last sync (by this or any other process): ids above
+    the highest one loaded, and the recent gaps below it.
+    """
+    with _lock:
+        now = time.monotonic()
+        floor = _state['max_id'] - MAX_GAPS
+        _state['gaps'] = {pid: seen for pid, seen in _state['gaps'].items()
+                          if now - seen < GAP_SECONDS and pid > floor}
+        known_max, gaps = _state['max_id'], sorted(_state['gaps'])
+
+    if not gaps and (db.query(func.max(Property.id)).scalar() or 0) <= known_max:
+        return
+    condition = Property.id > known_max
+    if gaps:
+        condition = or_(condition, Property.id.in_(gaps))
+    rows = (
+        db.query(Property.id, Property.title, Property.location)
+        .filter(condition)
+        .order_by(Property.id)
+        .yield_per(5000)
+    )
+    for pid, title, location in rows:
+        add_property(pid, title, location)
+
+
+def rebuild(db):
+    """ Rebuilds the index from the DB (startup). """
+    with _lock:
+        _indexes['location'] = TrigramIndex()
+        _indexes['title'] = TrigramIndex()
+        _state['max_id'] = 0
+        _state['gaps'] = {}
+    sync(db)
+
+
+def resolvable(value):
+    return bool(value) and len(value.strip()) >= MIN_QUERY_LEN
+
+
+def match(db, **fields):
+    """
+    Candidate ids for substring filters, e.g. match(db, location='ber', title=None).
+    Only resolvable() values are matched; the caller still applies ILIKE for the others.
+    Returns None when nothing could be resolved (or the match is too broad); the caller
+    must then apply all filters itself.
+    """
+    queries = {
+        field: value.strip().lower()
+        for field, value in fields.items()
+        if resolvable(value)
+    }
+    if not queries:
+        return None
+
+    sync(db)
+    result = None
+    with _lock:
+        for field, query in queries.items():
+            ids = _indexes[field].match(query)
+            result = ids if result is None else result & ids
+            if not result:
+                break
+    if len(result) > MAX_CANDIDATES:
+        return None
+    return result
@@ -0,0 +1,111 @@
+"""
+Streaming multipart uploads.
+
+Werkzeug hands each file part of a multipart body to Request._get_file_stream while it
+reads the body. UploadRequest returns a spool that keeps at most SPOOL_MEMORY_BYTES of a
+file in memory (larger files go to a temp file under IMAGE_SPOOL_DIR, which move_to then
+renames into place instead of copying it) and enforces the per-file limits as the bytes
+arrive: a part that is too large (413) or doesn't start like an image (415) fails the
+request right away, before the rest of the body is read.
+"""
+import io
+import os
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from config import Config
+
+
+# Bytes of each uploaded file kept in memory before it spills to disk
+SPOOL_MEMORY_BYTES = 256 * 1024
+
+# Leading bytes of the accepted image formats
+_SIGNATURE_LEN = 12
+
+
+def looks_like_image(head):
+    return (
+        head.startswith(b'\xff\xd8\xff')                          # JPEG
+        or head.startswith(b'\x89PNG\r\n\x1a\n')                  # PNG
+        or head[:6] in (b'GIF87a', b'GIF89a')                     # GIF
+        or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')        # WebP
+        or head[4:8] == b'ftyp'                                   # HEIC/HEIF/AVIF
+        or head[:4] in (b'II*\x00', b'MM\x00*')                   # TIFF
+        or head[:2] == b'BM'                                      # BMP
+    )
+
+
+class LimitedSpool:
+    """ Write side of an uploaded file: size limit and image check applied while writing. """
+
+    def __init__(self, filename, max_bytes):
+        self._file = io.BytesIO()
+        self._path = None  # the temp file, once the upload outgrew SPOOL_MEMORY_BYTES
+        self._filename = filename
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._head = b''
+
+    def _rollover(self):
+        os.makedirs(Config.IMAGE_SPOOL_DIR, exist_ok=True)
+        disk = tempfile.NamedTemporaryFile(dir=Config.IMAGE_SPOOL_DIR, suffix='.part', delete=False)
+        disk.write(self._file.getvalue())
+        self._file.close()
+        self._file, self._path = disk, disk.name
+
+    def write(self, data):
+        self._size += len(data)
+        if self._size > self._max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(
+                f'{self._filename or "file"} is larger than {self._max_bytes // (1024 * 1024)} MB')
+        if len(self._head) < _SIGNATURE_LEN:
+            self._head += data[:_SIGNATURE_LEN - len(self._head)]
+            if len(self._head) >= _SIGNATURE_LEN and not looks_like_image(self._head):
+                self.close()
+                raise UnsupportedMediaType(f'{self._filename or "file"} is not a supported image')
+        if self._path is None and self._size > SPOOL_MEMORY_BYTES:
+            self._rollover()
+        return self._file.write(data)
+
+    def seek(self, *args):
+        # Called once the part is complete: reject files too short to identify
+        if len(self._head) < _SIGNATURE_LEN and not looks_like_image(self._head):
+            self.close()
+            raise UnsupportedMediaType(f'{self._filename or "file"} is not a supported image')
+        return self._file.seek(*args)
+
+    def move_to(self, path):
+        """ Puts the upload at `path`: a spilled file is renamed there, a small one written out. """
+        if self._path is None:
+            with open(path, 'wb') as f:
+                f.write(self._file.getvalue())
+            return
+        self._file.close()
+        os.replace(self._path, path)
+        self._path = None
+
+    def close(self):
+        # Also when the request is over: removes a temp file that was not moved
+        self._file.close()
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except FileNotFoundError:
+                pass
+            self._path = None
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """ Request class spooling multipart file parts through LimitedSpool. """
+
+    # Every file part counts; a few regular fields are allowed besides the files
+    max_form_parts = Config.IMAGE_MAX_COUNT + 16
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return LimitedSpool(filename, Config.IMAGE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,91 @@
+"""
+Booking vouchers: rendered in the background after a booking and stored on disk, so the
+booking request doesn't wait for ReportLab and the PDF can be downloaded again later.
+
+Files are named after the booking's voucher_code (random, never reused). A download that
+finds no file waits for the queued render, or renders and stores the voucher itself.
+"""
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from database import get_db
+from models import Booking, Property
+from utils.pdf_generator import generate_voucher_pdf
+
+
+_executor = ThreadPoolExecutor(max_workers=Config.VOUCHER_WORKERS, thread_name_prefix='voucher')
+_pending = {}  # booking id -> Future of a queued render
+_lock = threading.Lock()
+
+
+def new_code():
+    return secrets.token_urlsafe(16)
+
+
+def _path(voucher_code):
+    return os.path.join(Config.VOUCHER_DIR, f'{voucher_code}.pdf')
+
+
+def _store(voucher_code, data):
+    """ Writes the file atomically, so a reader never sees a partial PDF. """
+    os.makedirs(Config.VOUCHER_DIR, exist_ok=True)
+    path = _path(voucher_code)
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _load(voucher_code):
+    try:
+        with open(_path(voucher_code), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def render(booking, property_):
+    """ Renders and stores the voucher of a booking; returns the PDF bytes. """
+    data = generate_voucher_pdf(booking, booking.guest_info or {}, property_).getvalue()
+    _store(booking.voucher_code, data)
+    return data
+
+
+def _render_job(booking_id):
+    try:
+        with get_db() as db:
+            booking = db.get(Booking, booking_id)
+            if booking is None:
+                return None
+            return render(booking, db.get(Property, booking.property_id))
+    finally:
+        with _lock:
+            _pending.pop(booking_id, None)
+
+
+def submit(booking_id):
+    """ Queues the voucher of a committed booking for rendering. """
+    with _lock:
+        if booking_id not in _pending:
+            _pending[booking_id] = _executor.submit(_render_job, booking_id)
+
+
+def get_pdf(booking, property_):
+    """ The voucher's PDF bytes: stored file, queued render, or rendered now (and stored). """
+    data = _load(booking.voucher_code)
+    if data is not None:
+        return data
+
+    with _lock:
+        future = _pending.get(booking.id)
+    if future is not None:
+        try:
+            data = future.result()
+        except Exception:
+            data = None
+        if data is not None:
+            return data
+    return render(booking, property_)